@@ -63,10 +63,8 @@ def sim_facility(
 
         def process(self):
             self.enter(waitingline)
-            for EVSE in facility:
-                if EVSE.ispassive():
-                    EVSE.activate()
-                    break  # activate at most one charging station
+            if idle_facility:
+                idle_facility.pop().activate()  # activate at most one charging station
             self.passivate()
             print(f"EV charged at: {app.now()}")
 
@@ -91,6 +89,7 @@ def sim_facility(
                 self.length.tally(0)
                 while len(waitingline) == 0:
                     self.set_mode("Waiting")
+                    idle_facility.append(self)
                     self.passivate()
                 self.car = waitingline.pop()
                 self.length.tally(1)
@@ -131,6 +130,8 @@ def sim_facility(
     waitingline.length_of_stay.reset_monitors(stats_only=True)
 
     # Instantiate the EVSE's, list comprehension
+    # idle EVSE's put themselves on a stack, so an arriving EV finds one in O(1)
+    idle_facility = []
     facility = [EVSE(max_kw=max_kw) for _ in range(number_of_EVSE)]
 
     app.AnimateMonitor(
@@ -1,5 +1,23 @@
 import salabim as sim
 import pandas as pd
+from collections import deque
+
+
+# ------------------------------------------------------------
+# EV as a plain record instead of a salabim component
+# ------------------------------------------------------------
+class EV:
+    __slots__ = ("name", "arrival", "max_kw", "kwh_req", "stay", "kwh_charged", "evse_name")
+
+    def __init__(self, name, arrival, max_kw, kwh_req, stay):
+        self.name = name
+        self.arrival = arrival
+        # energy request in kwh
+        self.max_kw = max_kw
+        self.kwh_req = kwh_req
+        self.stay = stay
+        self.kwh_charged = 0
+        self.evse_name = None
 
 
 # ------------------------------------------------------------
@@ -36,33 +54,26 @@ def sim_e_parking(
         def process(self):
             ev = 1
             while ev <= self.no_of_ev:
-                EV()
+                waitingline.append(
+                    EV(
+                        name=f"ev.{ev - 1}",
+                        arrival=app.now(),
+                        max_kw=ev_max_kw,
+                        kwh_req=energy_request_distr.sample(),
+                        stay=ev_stay,
+                    )
+                )
+                queue_length.tally(len(waitingline))
+                for PLOT in e_parking_plots:
+                    if PLOT.ispassive():
+                        PLOT.activate()
+                        break  # activate at most one parking lot
                 iat = inter_arr_time_distr.sample()
                 if fixed_utilization:
                     iat = iat / number_of_EVSEs
                 self.hold(iat)
                 ev += 1
 
-    class EV(sim.Component):
-        def setup(self):
-            # energy request in kwh
-            self.max_kw = ev_max_kw
-            self.kwh_req = energy_request_distr.sample()
-            self.stay = ev_stay
-            self.kwh_charged = 0
-            self.evse_name = None
-
-        def process(self):
-            self.enter(waitingline)
-            for PLOT in e_parking_plots:
-                if PLOT.ispassive():
-                    PLOT.activate()
-                    break  # activate at most one parking lot
-            self.passivate()
-            print(
-                f"EV: {self.name()} charged: {100*self.kwh_charged/self.kwh_req}% station: {self.evse_name} left at: {app.now()}"
-            )
-
     class PLOT(sim.Component):
         def setup(self):
 
@@ -92,7 +103,9 @@ def sim_e_parking(
                 self.length.tally(0)
                 while len(waitingline) == 0:
                     self.passivate()
-                self.ev = waitingline.pop()
+                self.ev = waitingline.popleft()
+                queue_length.tally(len(waitingline))
+                queue_stay.tally(app.now() - self.ev.arrival)
                 self.length.tally(1)
                 # determine power (if no EVSE then 0)
                 power = min(
@@ -122,7 +135,9 @@ def sim_e_parking(
                 self.power_consumption.tally(0)
                 # plain parking
                 self.hold(self.ev.stay - time_constr_to_charge)
-                self.ev.activate()
+                print(
+                    f"EV: {self.ev.name} charged: {100*self.ev.kwh_charged/self.ev.kwh_req}% station: {self.ev.evse_name} left at: {app.now()}"
+                )
 
     class TMON(sim.Component):
         def setup(self):
@@ -150,12 +165,12 @@ def sim_e_parking(
     # Instantiate and activate the client generator
     EV_Generator(name="Electric Vehicles Generator", number_of_EVs=number_of_EVs)
 
-    # Create Queue and set monitor to stats_only
-    # https://www.salabim.org/manual/Queue.html
-    waitingline = sim.Queue(name="Waiting EV's", monitor=True)
-    # waitingline.length_of_stay.monitor(value=True)
-    waitingline.length.reset_monitors(stats_only=True)
-    waitingline.length_of_stay.reset_monitors(stats_only=True)
+    # Create the waiting line of EV records with stats_only monitors
+    waitingline = deque()
+    queue_length = sim.Monitor(
+        name="Length of Waiting EV's", level=True, initial_tally=0, stats_only=True
+    )
+    queue_stay = sim.Monitor(name="Length of stay in Waiting EV's", stats_only=True)
 
     # Create EVSE Pool and ENEXIS connection as capacity Resources
     EVSE_POOL = sim.Resource("EVSE's", capacity=number_of_EVSEs)
@@ -243,8 +258,8 @@ def sim_e_parking(
         "evse": number_of_EVSEs,
         # "RO": total_evse_lngt / number_of_EVSEs,
         "P0": 0,
-        "Lq": waitingline.length.mean(),
-        "Wq": waitingline.length_of_stay.mean(),
+        "Lq": queue_length.mean(),
+        "Wq": queue_stay.mean(),
         # "Ls": total_evse_lngt + waitingline.length.mean(),
         # "Ws": total_evse_stay + waitingline.length_of_stay.mean(),
     }
@@ -6,16 +6,20 @@ import numpy as np
 # student-t distribution
 # https://en.wikipedia.org/wiki/Student%27s_t-distribution#Table_of_selected_values
 # https://docs.scipy.org/doc/scipy/reference/generated/scipy.stats.t.html
-def t_sd(df, col, confidence_interval, sides="both", decimals=3):
+def t_sd(df, col, confidence_interval, sides="both", decimals=3, controls=None):
     """
     Calculate the mean, confidence interval, standard deviation, and other statistics for a given column in a DataFrame.
 
+    With controls, the mean is the control-variates estimate of control_variate_estimate and the
+    standard deviation the one of a plain mean with the same standard error.
+
     Parameters:
     - df: DataFrame - The input DataFrame.
     - col: str - The name of the column of interest.
     - confidence_interval: float - The desired confidence interval (between 0 and 1).
     - sides: str - The type of confidence interval. Default is "both".
     - decimals: int - The number of decimal places to round the results. Default is 3.
+    - controls: tuple - The control variates, see CONTROLS. Default is None, no control variates.
 
     Returns:
     - DataFrame - A DataFrame containing the calculated statistics.
@@ -29,25 +33,163 @@ def t_sd(df, col, confidence_interval, sides="both", decimals=3):
     # column of interest
     x = df[col]
 
+    if controls:
+        mean, std_error, dof = control_variate_estimate(df, col, controls)
+        stdv = std_error * np.sqrt(len(x))
+    else:
+        # Note: ddof=1 for sample
+        mean, stdv, dof = x.mean(), x.std(ddof=1), len(x) - 1
+
     # number of SD for confidence interval 
-    # Note: ddof=1 for sample
-    tdst = st.t.ppf(ci, df=len(x) - 1)
+    tdst = st.t.ppf(ci, df=dof)
 
     return pd.DataFrame(
         {
             "c": df["c"].unique()[0],
             "name": col,
-            "mean": x.mean().round(decimals),
-            "lbnd": (x.mean() - tdst * x.std(ddof=1) / np.sqrt(len(x))).round(decimals),
-            "ubnd": (x.mean() + tdst * x.std(ddof=1) / np.sqrt(len(x))).round(decimals),
-            "stdv": x.std(ddof=1).round(decimals),
-            "tdst": tdst.round(decimals),
+            "mean": np.round(mean, decimals),
+            "lbnd": np.round(mean - tdst * stdv / np.sqrt(len(x)), decimals),
+            "ubnd": np.round(mean + tdst * stdv / np.sqrt(len(x)), decimals),
+            "stdv": np.round(stdv, decimals),
+            "tdst": np.round(tdst, decimals),
             "runs": len(x),
         },
         index=[0],
     )
 
 
+def relative_half_width(df, col, confidence_interval=0.95):
+    """
+    Calculate the half-width of the confidence interval of a column relative to its mean, as in t_sd.
+
+    Parameters:
+    - df: DataFrame - The input DataFrame with the runs of one 'c'.
+    - col: str - The name of the column of interest.
+    - confidence_interval: float - The desired confidence interval (between 0 and 1). Default is 0.95.
+
+    Returns:
+    - float - The relative half-width, 0 if mean and half-width are both 0 and inf for less than 2 runs.
+    """
+    if len(df) < 2:
+        return np.inf
+
+    res = t_sd(df, col, confidence_interval, sides="both", decimals=12).iloc[0]
+    half_width = (res["ubnd"] - res["lbnd"]) / 2
+    if half_width == 0:
+        return 0.0
+    if res["mean"] == 0:
+        return np.inf
+    return abs(half_width / res["mean"])
+
+
+# Marginal Standard Error Rule (MSER) for the warm-up period
+# https://doi.org/10.1109/WSC.2014.7019895
+def mser(x, batch_size=5):
+    """
+    Determine the warm-up period of an output series with the MSER rule.
+
+    The series is averaged in batches of batch_size (MSER-5 by default) and truncated at the
+    batch which minimizes the standard error of the mean of the remaining batches. Only the
+    first half of the batches is considered.
+
+    Parameters:
+    - x: array-like - The output series in order of observation, e.g. the waiting times.
+    - batch_size: int - The number of observations per batch. Default is 5.
+
+    Returns:
+    - int - The number of observations to discard.
+    """
+    x = np.asarray(x, dtype=float)
+    k = len(x) // batch_size
+    if k < 2:
+        return 0
+
+    # batch means and the sums over the remaining batches for each truncation point
+    z = x[: k * batch_size].reshape(k, batch_size).mean(axis=1)
+    n = np.arange(k, 0, -1)
+    s1 = np.cumsum(z[::-1])[::-1]
+    s2 = np.cumsum((z**2)[::-1])[::-1]
+    mser_d = (s2 - s1**2 / n) / n**2
+
+    d = int(np.argmin(mser_d[: k // 2 + 1]))
+    return d * batch_size
+
+
+# the metrics of a run of sim_facility
+SIM_METRICS = ["lambda", "mu", "RO", "P0", "Lq", "Wq", "Ls", "Ws"]
+
+# dtypes of the columns of the simulation results
+SIM_RESULTS_DTYPES = {
+    "run": "int64",
+    "lambda": "float64",
+    "mu": "float64",
+    "c": "int64",
+    "RO": "float64",
+    "P0": "float64",
+    "Lq": "float64",
+    "Wq": "float64",
+    "Ls": "float64",
+    "Ws": "float64",
+    "warmup": "float64",
+    "iat": "float64",
+    "service": "float64",
+    "pair": "int64",
+    "spawn_key": "str",
+}
+
+
+def apply_sim_results_dtypes(df_sim):
+    """
+    Cast the columns of simulation results to SIM_RESULTS_DTYPES, other columns are kept as they are.
+    """
+    return df_sim.astype({col: dtype for col, dtype in SIM_RESULTS_DTYPES.items() if col in df_sim.columns})
+
+
+def write_sim_results(df_sim, ffn_results):
+    """
+    Save simulation results, the format follows from the extension of the filename.
+
+    Parquet (.parquet) and Feather (.feather) keep the full precision and the dtypes, they need pyarrow.
+    Other extensions give the semicolon separated csv with 3 decimals.
+
+    Parameters:
+    - df_sim (DataFrame): The simulation results.
+    - ffn_results (str): The full filename of the results.
+    """
+    if ffn_results.endswith(".parquet"):
+        apply_sim_results_dtypes(df_sim).to_parquet(ffn_results, index=False)
+    elif ffn_results.endswith(".feather"):
+        apply_sim_results_dtypes(df_sim).reset_index(drop=True).to_feather(ffn_results)
+    else:
+        df_sim.to_csv(
+            path_or_buf=ffn_results,
+            sep=";",
+            index=False,
+            header=True,
+            decimal=".",
+            float_format="%.3f",
+        )
+
+
+def read_sim_results(ffn_results):
+    """
+    Read simulation results saved by write_sim_results, the format follows from the extension of the filename.
+
+    Parameters:
+    - ffn_results (str): The full filename of the results.
+
+    Returns:
+    - DataFrame: The simulation results with the dtypes of SIM_RESULTS_DTYPES.
+    """
+    if ffn_results.endswith(".parquet"):
+        df_sim = pd.read_parquet(ffn_results)
+    elif ffn_results.endswith(".feather"):
+        df_sim = pd.read_feather(ffn_results)
+    else:
+        df_sim = pd.read_csv(ffn_results, sep=";", decimal=".")
+    return apply_sim_results_dtypes(df_sim)
+
+
 # Calculate mean and confidence interval for waiting time
 # df_evse = df_sim.groupby('c')['Wq'].agg(['mean', 'count']).reset_index()
 
@@ -70,46 +212,328 @@ def sim_mean_and_ci(df_sim, col):
     Returns:
     - pandas.DataFrame: A DataFrame containing the mean and confidence interval for each 'c' group.
     """
-    res = []
-    for c in df_sim["c"].unique():
-        df_evse = df_sim[df_sim["c"] == c]
+    return grouped_mean_with_ci(df_sim, [col], confidence_interval=0.95, decimals=2)
 
-        res.append(
-            t_sd(df_evse, col, confidence_interval=0.95, sides="both", decimals=2)
-        )
 
-    # return results
-    return pd.concat(res, axis=0, ignore_index=True)
+def grouped_mean_with_ci(df_sim, columns, confidence_interval=0.95, decimals=2):
+    """
+    Calculate the mean and two-sided confidence interval of each column for each 'c' group, as t_sd.
 
+    All groups and columns are computed at once with a single groupby.
 
+    Parameters:
+    - df_sim (pandas.DataFrame): The simulation results.
+    - columns (list): The columns of interest.
+    - confidence_interval (float, optional): The desired confidence interval. Defaults to 0.95.
+    - decimals (int, optional): The number of decimal places. Defaults to 2.
 
-def get_mean_with_ci(df_sim):
+    Returns:
+    - pandas.DataFrame: The columns of t_sd, ordered by column and then by 'c' in order of appearance.
+    """
+    grouped = df_sim.groupby("c", sort=False)[list(columns)]
+    mean = grouped.mean()
+    stdv = grouped.std(ddof=1)
+    # t_sd counts all runs, as len(x)
+    n = grouped.size().to_numpy()[:, None] * np.ones((1, len(columns)), dtype="int64")
+
+    # column-major, so the rows of a column are together
+    return ci_table(
+        c=np.tile(mean.index.to_numpy(), len(columns)),
+        name=np.repeat(list(columns), len(mean)),
+        n=n.T.ravel(),
+        mean=mean.to_numpy(dtype=float).T.ravel(),
+        stdv=stdv.to_numpy(dtype=float).T.ravel(),
+        confidence_interval=confidence_interval,
+        decimals=decimals,
+    )
+
+
+def ci_table(c, name, n, mean, stdv, confidence_interval, decimals, dof=None):
+    """
+    Build the table of t_sd from arrays with one element per 'c' and column.
+
+    The degrees of freedom of the t-distribution are n - 1, unless dof is given.
+    """
+    tdst = st.t.ppf(confidence_interval + (1 - confidence_interval) / 2, df=n - 1 if dof is None else dof)
+    half_width = tdst * stdv / np.sqrt(n)
+
+    return pd.DataFrame(
+        {
+            "c": c,
+            "name": name,
+            "mean": mean.round(decimals),
+            "lbnd": (mean - half_width).round(decimals),
+            "ubnd": (mean + half_width).round(decimals),
+            "stdv": stdv.round(decimals),
+            "tdst": tdst.round(decimals),
+            "runs": n,
+        }
+    )
+
+
+
+def pair_average(df_sim):
+    """
+    Average the two runs of each antithetic pair, so the pairs become the independent observations.
+
+    Parameters:
+    df_sim (DataFrame): The simulation results with a 'pair' column.
+
+    Returns:
+    DataFrame: One row per 'c' and pair, with the pair number as run.
+    """
+    return (
+        df_sim.groupby(["c", "pair"], sort=False)
+        .mean(numeric_only=True)
+        .reset_index()
+        .assign(run=lambda df: df["pair"])
+        .drop(columns="pair")
+    )
+
+
+# sufficient statistics of the runs, which can be merged without keeping the runs
+def sufficient_statistics(sim_runs, metrics=SIM_METRICS):
+    """
+    Reduce runs to the count, sum, sum of squares, minimum and maximum per 'c' and metric.
+
+    Antithetic pairs are averaged first, so the statistics are of independent observations.
+
+    Parameters:
+    sim_runs (list): The results of sim_facility.
+    metrics (list, optional): The metrics. Defaults to SIM_METRICS.
+
+    Returns:
+    list: A dict with c, name, n, sum, sumsq, min and max per 'c' and metric.
+    """
+    df_sim = pd.DataFrame(sim_runs)
+    if "pair" in df_sim.columns:
+        df_sim = pair_average(df_sim)
+
+    statistics = []
+    for c, df_evse in df_sim.groupby("c", sort=False):
+        for name in metrics:
+            x = df_evse[name].to_numpy(dtype=float)
+            statistics.append(
+                {
+                    "c": int(c),
+                    "name": name,
+                    "n": len(x),
+                    "sum": float(x.sum()),
+                    "sumsq": float((x**2).sum()),
+                    "min": float(x.min()),
+                    "max": float(x.max()),
+                }
+            )
+    return statistics
+
+
+def merge_statistics(total, statistics):
+    """
+    Merge sufficient statistics into the running total, a dict keyed by ('c', name).
+    """
+    for s in statistics:
+        key = (s["c"], s["name"])
+        if key not in total:
+            total[key] = dict(s)
+            continue
+        t = total[key]
+        t["n"] += s["n"]
+        t["sum"] += s["sum"]
+        t["sumsq"] += s["sumsq"]
+        t["min"] = min(t["min"], s["min"])
+        t["max"] = max(t["max"], s["max"])
+    return total
+
+
+def statistics_mean_with_ci(df_stats, confidence_interval=0.95, decimals=2):
+    """
+    Calculate the mean and two-sided confidence interval from merged sufficient statistics, as t_sd.
+
+    Parameters:
+    df_stats (DataFrame): The statistics with columns c, name, n, sum, sumsq, min and max.
+    confidence_interval (float, optional): The desired confidence interval. Defaults to 0.95.
+    decimals (int, optional): The number of decimal places. Defaults to 2.
+
+    Returns:
+    DataFrame: The columns of t_sd, ordered by metric and 'c'.
+    """
+    # order by metric, then by 'c' in order of appearance
+    order = {name: i for i, name in enumerate(SIM_METRICS)}
+    df_stats = df_stats.assign(
+        metric_order=df_stats["name"].map(order),
+        c_order=df_stats["c"].map({c: i for i, c in enumerate(df_stats["c"].unique())}),
+    ).sort_values(["metric_order", "c_order"], kind="stable")
+
+    n = df_stats["n"].to_numpy()
+    mean = df_stats["sum"].to_numpy() / n
+    # sample variance, ddof=1, rounding can make it slightly negative; nan for a single run
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = np.maximum(df_stats["sumsq"].to_numpy() - n * mean**2, 0.0) / (n - 1)
+
+    return ci_table(
+        c=df_stats["c"].to_numpy(),
+        name=df_stats["name"].to_numpy(),
+        n=n,
+        mean=mean,
+        stdv=np.sqrt(var),
+        confidence_interval=confidence_interval,
+        decimals=decimals,
+    )
+
+
+# control variates of a run, quantities with a known expectation which are correlated with the metrics
+CONTROL_VARIATES = ("iat", "service", "erlang_c")
+
+# the default controls; erlang_c is a function of iat and service, it is an alternative to them,
+# together they are nearly collinear and widen the confidence intervals of short sweeps
+CONTROLS = ("iat", "service")
+
+# the metrics which are estimated with control variates, the others are constant
+CONTROLLED_METRICS = ["RO", "Lq", "Wq", "Ls", "Ws"]
+
+
+def control_expectations(df_sim, controls=CONTROLS):
+    """
+    Return the controls of the runs and their expectations.
+
+    iat and service are the sample means of the inter-arrival and charging times of a run in
+    minutes, their expectations follow from the lambda and mu columns. erlang_c is the Erlang C
+    probability of waiting at the rates of these sample means, its expectation is taken as the
+    value at the true rates, which is exact up to a bias of the order of one over the number
+    of EV's of a run.
+
+    Parameters:
+    df_sim (DataFrame): The simulation results with the iat and service columns.
+    controls (tuple, optional): The controls, a subset of CONTROL_VARIATES. Defaults to CONTROLS.
+
+    Returns:
+    tuple: DataFrames with the observed and the expected controls, one column per control.
+    """
+    # sim_erlang imports sim_analysis, so it can not be imported at the top
+    from sim_erlang import erlang_c
+
+    unknown = set(controls) - set(CONTROL_VARIATES)
+    if unknown:
+        raise ValueError(f"unknown controls {sorted(unknown)}, use {list(CONTROL_VARIATES)}")
+    if not {"iat", "service"} <= set(df_sim.columns):
+        raise ValueError("the runs have no iat and service columns, simulate them again for control variates")
+
+    c = df_sim["c"].to_numpy()
+    iat, service = df_sim["iat"].to_numpy(dtype=float), df_sim["service"].to_numpy(dtype=float)
+    lmbda, mu = df_sim["lambda"].to_numpy(dtype=float), df_sim["mu"].to_numpy(dtype=float)
+    observed = {"iat": iat, "service": service, "erlang_c": erlang_c(c, service / iat)}
+    expected = {"iat": 60 / lmbda, "service": 60 / mu, "erlang_c": erlang_c(c, lmbda / mu)}
+    return (
+        pd.DataFrame({name: observed[name] for name in controls}, index=df_sim.index),
+        pd.DataFrame({name: expected[name] for name in controls}, index=df_sim.index),
+    )
+
+
+def control_variate_estimate(df, col, controls=CONTROLS):
+    """
+    Estimate the mean of a column of the runs of one 'c' with control variates.
+
+    The column is regressed on the deviations of the controls from their expectations, the
+    intercept is the estimate. A control which is constant, e.g. the charging time of a
+    deterministic distribution, drops out of the regression.
+
+    Parameters:
+    df (DataFrame): The runs of one 'c'.
+    col (str): The name of the column of interest.
+    controls (tuple, optional): The controls, see control_expectations. Defaults to CONTROLS.
+
+    Returns:
+    tuple: The estimate, its standard error and the degrees of freedom of its t-distribution.
+    """
+    observed, expected = control_expectations(df, controls)
+    y = df[col].to_numpy(dtype=float)
+    z = np.column_stack([np.ones(len(y)), (observed - expected).to_numpy(dtype=float)])
+
+    beta = np.linalg.lstsq(z, y, rcond=None)[0]
+    residuals = y - z @ beta
+    dof = len(y) - np.linalg.matrix_rank(z)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variance = residuals @ residuals / dof
+    return beta[0], np.sqrt(variance * np.linalg.pinv(z.T @ z)[0, 0]), dof
+
+
+def grouped_mean_with_control_variates(df_sim, columns, controls=CONTROLS, confidence_interval=0.95, decimals=2):
+    """
+    Calculate the mean and confidence interval of each column for each 'c' group as grouped_mean_with_ci,
+    with control variates for the columns of CONTROLLED_METRICS.
+
+    Parameters:
+    - df_sim (pandas.DataFrame): The simulation results with the iat and service columns.
+    - columns (list): The columns of interest.
+    - controls (tuple, optional): The controls, see control_expectations. Defaults to CONTROLS.
+    - confidence_interval (float, optional): The desired confidence interval. Defaults to 0.95.
+    - decimals (int, optional): The number of decimal places. Defaults to 2.
+
+    Returns:
+    - pandas.DataFrame: The columns of t_sd, ordered by column and then by 'c' in order of appearance.
+    """
+    groups = list(df_sim.groupby("c", sort=False))
+    rows = []
+    for col in columns:
+        for c, df_evse in groups:
+            n = len(df_evse)
+            if col in CONTROLLED_METRICS:
+                mean, std_error, dof = control_variate_estimate(df_evse, col, controls)
+                rows.append((c, col, n, mean, std_error * np.sqrt(n), dof))
+            else:
+                x = df_evse[col]
+                rows.append((c, col, n, x.mean(), x.std(ddof=1), n - 1))
+
+    c, name, n, mean, stdv, dof = (np.array(values) for values in zip(*rows))
+    return ci_table(
+        c=c,
+        name=name,
+        n=n,
+        mean=mean.astype(float),
+        stdv=stdv.astype(float),
+        confidence_interval=confidence_interval,
+        decimals=decimals,
+        dof=dof,
+    )
+
+
+def get_mean_with_ci(df_sim, controls=None):
     """
     Calculate the mean and confidence interval for each column in the given DataFrame.
 
     Parameters:
-    df_sim (DataFrame): The input DataFrame containing simulation data.
+    df_sim (DataFrame): The input DataFrame containing simulation data, or the merged sufficient
+        statistics of a sweep with reduce=True.
+    controls (tuple, optional): If given, estimate CONTROLLED_METRICS with these control variates,
+        e.g. CONTROLS, which narrows their confidence intervals. Defaults to None.
 
     Returns:
     DataFrame: A DataFrame containing the mean and confidence interval for each column.
     """
-    # Create an empty DataFrame to store the results
-    res = []
+    # merged sufficient statistics instead of runs
+    if "sumsq" in df_sim.columns:
+        if controls:
+            raise ValueError("control variates need the runs, not their sufficient statistics")
+        return statistics_mean_with_ci(df_sim, confidence_interval=0.95, decimals=2)
+
+    # antithetic runs are not independent, the confidence interval follows from the pair averages
+    if "pair" in df_sim.columns:
+        df_sim = pair_average(df_sim)
 
-    # Loop over each column in the DataFrame
-    for column in ['lambda', 'mu', 'RO', 'P0', 'Lq', 'Wq', 'Ls', 'Ws']:
-        # Apply the function to the column and store the result
-        res.append(sim_mean_and_ci(df_sim, df_sim[column].name))
+    if controls:
+        return grouped_mean_with_control_variates(df_sim, SIM_METRICS, controls, confidence_interval=0.95, decimals=2)
 
-    return pd.concat(res, axis=0, ignore_index=True)
+    # all metrics and numbers of EVSE's at once
+    return grouped_mean_with_ci(df_sim, SIM_METRICS, confidence_interval=0.95, decimals=2)
 
-def get_sim_summary(df_sim, output=False):
+def get_sim_summary(df_sim, output=False, controls=None):
     """
     Get the summary of simulation results.
 
     Parameters:
-    - df_sim (DataFrame): The simulation results DataFrame.
+    - df_sim (DataFrame): The simulation results DataFrame, or the merged sufficient statistics.
     - output (bool): Whether to print the results or not. Default is False.
+    - controls (tuple): If given, the control variates of get_mean_with_ci, e.g. CONTROLS. Default is None.
 
     Returns:
     - df_pivot (DataFrame): The summarized results DataFrame.
@@ -118,7 +542,7 @@ def get_sim_summary(df_sim, output=False):
     idx = 'c'
 
     # aggregate to get the means
-    df_res = get_mean_with_ci(df_sim)
+    df_res = get_mean_with_ci(df_sim, controls)
 
     # get the maximum number of runs
     max_runs = df_res['runs'].max()
@@ -0,0 +1,188 @@
+# Description: approximations of the GI/G/c queue, to screen designs before simulating them
+
+import numpy as np
+import pandas as pd
+
+from sim_erlang import cnv_hr_to_mins, erlang_c, facility_rates
+from sim_sampler import scv
+from sim_sweep import expand_sweep, scenario_distributions
+
+# the approximations of the waiting time, see approximate_wq
+APPROXIMATIONS = ("allen_cunneen", "kingman", "whitt")
+
+
+# ------------------------------------------------------------
+# waiting time approximations
+# ------------------------------------------------------------
+def whitt_factor(rho, ca2, cs2, c):
+    """
+    Correction factor phi of Whitt (1993) to the Allen-Cunneen waiting time of a GI/G/c queue.
+
+    The factor is 1 for M/M/c and for c = 1 it makes M/D/1 exact.
+
+    Args:
+        rho (float or array): The utilization per server, below 1.
+        ca2 (float or array): The squared coefficient of variation of the inter-arrival times.
+        cs2 (float or array): The squared coefficient of variation of the service times.
+        c (int or array): The number of servers.
+
+    Returns:
+        float or numpy.ndarray: The correction factor.
+    """
+    rho, ca2, cs2, c = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (rho, ca2, cs2, c)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = np.minimum(0.24, (1 - rho) * (c - 1) * (np.sqrt(4 + 5 * c) - 2) / (16 * c * rho))
+        phi1 = 1 + gamma
+        phi3 = (1 - 4 * gamma) * np.exp(-2 * (1 - rho) / (3 * rho))
+        phi4 = np.minimum(1, (phi1 + phi3) / 2)
+        v = (ca2 + cs2) / 2
+        psi = np.where(v >= 1, 1.0, phi4 ** (2 * (1 - v)))
+        phi = np.where(
+            ca2 >= cs2,
+            4 * (ca2 - cs2) / (4 * ca2 - 3 * cs2) * phi1 + cs2 / (4 * ca2 - 3 * cs2) * psi,
+            (cs2 - ca2) / (2 * (ca2 + cs2)) * phi3 + (cs2 + 3 * ca2) / (2 * (ca2 + cs2)) * psi,
+        )
+    # a deterministic D/D/c queue never waits
+    return np.where((ca2 == 0) & (cs2 == 0), 0.0, phi)
+
+
+def approximate_wq(lmbda, mu, number_of_EVSE, ca2, cs2, method="allen_cunneen"):
+    """
+    Approximate the mean waiting time of a GI/G/c queue from the rates and the variability.
+
+    All arguments can be arrays, so thousands of designs are evaluated at once.
+
+    - allen_cunneen: the M/M/c waiting time times (ca2 + cs2) / 2.
+    - kingman: Kingman's heavy traffic formula, extended to c servers by Sakasegawa,
+      without the Erlang C formula.
+    - whitt: Allen-Cunneen with the correction factor of Whitt (1993), see whitt_factor.
+
+    Allen-Cunneen and Whitt are exact for M/M/c. Kingman is exact for M/M/1 only, for more
+    servers it overestimates the M/M/c waiting time, e.g. by 3% at c = 3 and a utilization
+    of 0.8 and by 19% at 0.5.
+
+    Args:
+        lmbda (float or array): The arrival rate per hour.
+        mu (float or array): The service rate of an EVSE per hour.
+        number_of_EVSE (int or array): The number of EVSE's.
+        ca2 (float or array): The squared coefficient of variation of the inter-arrival times.
+        cs2 (float or array): The squared coefficient of variation of the service times.
+        method (str, optional): One of APPROXIMATIONS. Defaults to "allen_cunneen".
+
+    Returns:
+        float or numpy.ndarray: The mean waiting time in minutes, inf if the queue is not stable.
+    """
+    if method not in APPROXIMATIONS:
+        raise ValueError(f"unknown approximation {method!r}, use {list(APPROXIMATIONS)}")
+
+    lmbda, mu, c, ca2, cs2 = np.broadcast_arrays(
+        *(np.asarray(x, dtype=float) for x in (lmbda, mu, number_of_EVSE, ca2, cs2))
+    )
+    a = lmbda / mu
+    rho = a / c
+    variability = (ca2 + cs2) / 2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if method == "kingman":
+            wq = variability * rho ** (np.sqrt(2 * (c + 1)) - 1) / (c * (1 - rho)) / mu
+        else:
+            wq = variability * erlang_c(c.astype("int64"), a) / (c * mu - lmbda)
+            if method == "whitt":
+                wq = wq * whitt_factor(rho, ca2, cs2, c)
+
+    wq = np.where(rho >= 1, np.inf, wq * cnv_hr_to_mins)
+    return wq if wq.ndim else float(wq)
+
+
+# ------------------------------------------------------------
+# results in the schema of sim_facility
+# ------------------------------------------------------------
+def approximate_designs(df_designs, method="allen_cunneen"):
+    """
+    Approximate the results of a table of designs in one vectorized pass.
+
+    Args:
+        df_designs (DataFrame): The designs, with the columns lambda and mu (per hour), c and
+            the squared coefficients of variation ca2 and cs2.
+        method (str, optional): One of APPROXIMATIONS. Defaults to "allen_cunneen".
+
+    Returns:
+        DataFrame: The designs with the columns RO, Lq, Wq, Ls and Ws of sim_facility, in minutes,
+            and the method. P0 has no approximation and is not added.
+    """
+    lmbda, mu, c = df_designs["lambda"], df_designs["mu"], df_designs["c"]
+    wq = approximate_wq(lmbda, mu, c, df_designs["ca2"], df_designs["cs2"], method)
+    lq = lmbda * wq / cnv_hr_to_mins
+    return df_designs.assign(
+        RO=lmbda / (mu * c),
+        Lq=lq,
+        Wq=wq,
+        Ls=lq + lmbda / mu,
+        Ws=wq + cnv_hr_to_mins / mu,
+        method=method,
+    )
+
+
+def ggc_for_range_of_EVSE(
+    inter_arr_time_distr,
+    energy_request_distr,
+    range_of_EVSE,
+    fixed_utilization=False,
+    method="allen_cunneen",
+):
+    """
+    Approximate results for a range of EVSE's, with the same distributions as sim_facility_for_range_of_EVSE.
+
+    Besides the means, the squared coefficients of variation of the distributions are used,
+    e.g. of the gamma fit of the energy requests, so the results hold for general distributions.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution, in minutes.
+        energy_request_distr: The energy request distribution, in minutes.
+        range_of_EVSE (range): The numbers of EVSE's.
+        fixed_utilization (bool, optional): Whether the arrivals scale with the number of EVSE's. Defaults to False.
+        method (str, optional): One of APPROXIMATIONS. Defaults to "allen_cunneen".
+
+    Returns:
+        pandas.DataFrame: One row per number of EVSE's.
+    """
+    rates = [
+        facility_rates(inter_arr_time_distr, energy_request_distr, c, fixed_utilization)
+        for c in range_of_EVSE
+    ]
+    df_designs = pd.DataFrame(
+        {
+            "lambda": [lmbda for lmbda, _ in rates],
+            "mu": [mu for _, mu in rates],
+            "c": list(range_of_EVSE),
+            "ca2": scv(inter_arr_time_distr),
+            "cs2": scv(energy_request_distr),
+        }
+    )
+    return approximate_designs(df_designs, method)
+
+
+def approximate_sweep(spec, method="allen_cunneen", sweep_method="grid", samples=10, random_seed=0):
+    """
+    Approximate all scenarios of a sweep specification, to pick the ones worth simulating with sim_sweep.
+
+    Args:
+        spec (dict): The sweep specification, see sim_sweep.expand_sweep.
+        method (str, optional): One of APPROXIMATIONS. Defaults to "allen_cunneen".
+        sweep_method (str, optional): "grid" or "lhs". Defaults to "grid".
+        samples (int, optional): The number of Latin hypercube points. Defaults to 10.
+        random_seed (int, optional): The seed of the Latin hypercube. Defaults to 0.
+
+    Returns:
+        pandas.DataFrame: One row per scenario, with the scenario columns followed by the results.
+    """
+    df_scenarios = expand_sweep(spec, sweep_method, samples, random_seed)
+    designs = []
+    for scenario in df_scenarios.to_dict("records"):
+        inter_arr_time_distr, energy_request_distr = scenario_distributions(scenario)
+        c = scenario["number_of_EVSE"]
+        lmbda, mu = facility_rates(inter_arr_time_distr, energy_request_distr, c, scenario["fixed_utilization"])
+        designs.append(
+            {"lambda": lmbda, "mu": mu, "c": c, "ca2": scv(inter_arr_time_distr), "cs2": scv(energy_request_distr)}
+        )
+    return pd.concat([df_scenarios, approximate_designs(pd.DataFrame(designs), method)], axis=1)
@@ -0,0 +1,149 @@
+# Description: content-addressed cache of the results of sim_facility
+
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from sim_facility import sim_facility
+from sim_sampler import distribution_params
+
+# default directory of the cache
+CACHE_DIR = "./sim_results/cache"
+
+# change when the model changes, so results of the old model are not reused
+CACHE_VERSION = 3
+
+# the defaults of sim_facility, so omitted and explicit default arguments give the same key
+SIM_FACILITY_DEFAULTS = {
+    k: p.default
+    for k, p in inspect.signature(sim_facility).parameters.items()
+    if p.default is not inspect.Parameter.empty and k not in ("random_seed", "run")
+}
+
+
+# ------------------------------------------------------------
+# key of a run
+# ------------------------------------------------------------
+def seed_key(random_seed):
+    """
+    Return a json representation of a random seed, or None if the seed is not reproducible.
+
+    Args:
+        random_seed: An int, a SeedSequence or "*" for fresh entropy.
+
+    Returns:
+        The seed as an int or a list, or None for "*".
+    """
+    if isinstance(random_seed, np.random.SeedSequence):
+        return [str(random_seed.entropy), list(random_seed.spawn_key)]
+    if random_seed == "*" or random_seed is None:
+        return None
+    return int(random_seed)
+
+
+def cache_key(inter_arr_time_distr, energy_request_distr, random_seed, **kwargs):
+    """
+    Hash the parameters of a run of sim_facility.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        energy_request_distr: The energy request distribution.
+        random_seed: The seed of the run, which must be reproducible.
+        **kwargs: The other keyword arguments of sim_facility, except run.
+
+    Returns:
+        str: The sha256 hex digest of the parameters.
+    """
+    params = {
+        "version": CACHE_VERSION,
+        "inter_arr_time_distr": distribution_params(inter_arr_time_distr),
+        "energy_request_distr": distribution_params(energy_request_distr),
+        "random_seed": seed_key(random_seed),
+        **kwargs,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+# ------------------------------------------------------------
+# sim_facility with a cache in front of it
+# ------------------------------------------------------------
+def cached_sim_facility(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    random_seed,
+    run=1,
+    cache_dir=CACHE_DIR,
+    **kwargs,
+):
+    """
+    Run sim_facility, or return the stored result of a run with the same parameters and seed.
+
+    The result is stored in cache_dir under the hash of the distribution parameters,
+    number_of_EVSE, sim_time, the seed and the other keyword arguments, so overlapping
+    sweeps, e.g. 20 and 40 replications of the same EVSE's, reuse the replications they
+    share. Runs with random_seed "*" are not reproducible and are never cached.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        energy_request_distr: The energy request distribution.
+        number_of_EVSE (int): The number of EVSE's.
+        sim_time (int): The simulation time.
+        random_seed: An int, a SeedSequence or "*" for fresh entropy.
+        run (int, optional): The run number in the result, which is not part of the key. Defaults to 1.
+        cache_dir (str, optional): The directory of the cache. Defaults to CACHE_DIR.
+        **kwargs: The other keyword arguments of sim_facility.
+
+    Returns:
+        The result of sim_facility.
+    """
+    if seed_key(random_seed) is None:
+        return sim_facility(
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            number_of_EVSE=number_of_EVSE,
+            sim_time=sim_time,
+            random_seed=random_seed,
+            run=run,
+            **kwargs,
+        )
+
+    key = cache_key(
+        inter_arr_time_distr,
+        energy_request_distr,
+        random_seed,
+        number_of_EVSE=number_of_EVSE,
+        sim_time=sim_time,
+        **{**SIM_FACILITY_DEFAULTS, **kwargs},
+    )
+    ffn = os.path.join(cache_dir, key[:2], key + ".json")
+
+    if os.path.exists(ffn):
+        with open(ffn) as f:
+            result = json.load(f)
+    else:
+        result = sim_facility(
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            number_of_EVSE=number_of_EVSE,
+            sim_time=sim_time,
+            random_seed=random_seed,
+            run=run,
+            **kwargs,
+        )
+        # write to a temporary file first, so parallel workers never read half a result
+        os.makedirs(os.path.dirname(ffn), exist_ok=True)
+        fd, ffn_tmp = tempfile.mkstemp(dir=os.path.dirname(ffn), suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(result, f, default=lambda x: x.item())
+        os.replace(ffn_tmp, ffn)
+
+    # the batches of batch means have their own run numbers
+    if isinstance(result, dict):
+        result["run"] = run
+    return result
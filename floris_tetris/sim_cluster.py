@@ -0,0 +1,267 @@
+# Description: run the tasks of a sweep on workers on other machines over TCP
+#
+# Start the coordinator in the notebook and pass it as the pool of a sweep:
+#
+#     with ClusterPool(host="0.0.0.0", port=5555, authkey="secret") as pool:
+#         df = sim_facility_for_range_of_EVSE(..., pool=pool)
+#
+# and start one or more workers on each lab machine, from this directory:
+#
+#     SIM_CLUSTER_AUTHKEY=secret python sim_cluster.py coordinator-host 5555
+#
+# For testing, start_local_workers starts workers on localhost.
+
+import argparse
+import hmac
+import itertools
+import os
+import queue
+import secrets
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import traceback
+
+import dill
+
+# environment variable with the shared key of the coordinator and the workers
+AUTHKEY_ENV = "SIM_CLUSTER_AUTHKEY"
+
+# length prefix of a frame
+HEADER = struct.Struct("!Q")
+
+# seconds a connecting worker gets to send the shared key
+HANDSHAKE_TIMEOUT = 10
+
+
+# ------------------------------------------------------------
+# length-prefixed frames
+# ------------------------------------------------------------
+def send_bytes(sock, payload):
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_bytes(sock):
+    (size,) = HEADER.unpack(recv_exactly(sock, HEADER.size))
+    return recv_exactly(sock, size)
+
+
+def recv_exactly(sock, size):
+    buffer = bytearray()
+    while len(buffer) < size:
+        chunk = sock.recv(min(size - len(buffer), 1 << 20))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        buffer += chunk
+    return bytes(buffer)
+
+
+def send_frame(sock, message):
+    send_bytes(sock, dill.dumps(message))
+
+
+def recv_frame(sock):
+    return dill.loads(recv_bytes(sock))
+
+
+# ------------------------------------------------------------
+# coordinator
+# ------------------------------------------------------------
+class ClusterPool:
+    """
+    Coordinator which hands tasks to workers over TCP and gathers their results.
+
+    The pool has the map and uimap methods of a pathos pool, so it can be passed as the
+    pool of sim_facility_for_range_of_EVSE or sim_sweep. Each worker gets one task at a
+    time; the task of a worker that disconnects is handed to another worker. Workers can
+    connect and leave at any time.
+
+    Frames are dill pickles, which can run code when they are loaded, so a worker must
+    send the shared key before the coordinator loads anything from it.
+
+    Args:
+        host (str, optional): The address to listen on, "0.0.0.0" for all interfaces. Defaults to "127.0.0.1".
+        port (int, optional): The port to listen on, 0 for a free port. Defaults to 0.
+        authkey (str, optional): The shared key. Defaults to the SIM_CLUSTER_AUTHKEY environment
+            variable, or a new random key for local workers.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, authkey=None):
+        self.authkey = authkey or os.environ.get(AUTHKEY_ENV) or secrets.token_hex(16)
+        self._server = socket.create_server((host, port))
+        self.host, self.port = self._server.getsockname()[:2]
+
+        self._tasks = queue.Queue()
+        self._results = {}
+        self._cancelled = set()
+        self._jobs = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.workers = 0
+
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    @property
+    def ncpus(self):
+        return max(1, self.workers)
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve_worker, args=(conn,), daemon=True).start()
+
+    def _authenticate(self, conn):
+        # the peer is not trusted yet, so only a frame of the length of the key is read, in limited time
+        key = self.authkey.encode()
+        conn.settimeout(HANDSHAKE_TIMEOUT)
+        (size,) = HEADER.unpack(recv_exactly(conn, HEADER.size))
+        if size != len(key):
+            return False
+        authenticated = hmac.compare_digest(recv_exactly(conn, size), key)
+        conn.settimeout(None)
+        return authenticated
+
+    def _serve_worker(self, conn):
+        try:
+            if not self._authenticate(conn):
+                return
+            with self._lock:
+                self.workers += 1
+            try:
+                while not self._closed.is_set():
+                    try:
+                        job, index, function, item = self._tasks.get(timeout=0.2)
+                    except queue.Empty:
+                        continue
+                    if job in self._cancelled:
+                        continue
+                    try:
+                        send_frame(conn, ("task", function, item))
+                        status, value = recv_frame(conn)
+                    except (OSError, EOFError):
+                        # the worker is gone, another worker gets its task
+                        self._tasks.put((job, index, function, item))
+                        return
+                    # the results of a job which failed or was abandoned are dropped
+                    results = self._results.get(job)
+                    if results is not None:
+                        results.put((index, status, value))
+                send_frame(conn, ("stop", None, None))
+            finally:
+                with self._lock:
+                    self.workers -= 1
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+    def _run(self, function, iterable):
+        items = list(iterable)
+        job = next(self._jobs)
+        results = self._results[job] = queue.Queue()
+        for index, item in enumerate(items):
+            self._tasks.put((job, index, function, item))
+        try:
+            for _ in items:
+                index, status, value = results.get()
+                if status == "error":
+                    raise RuntimeError(f"task {items[index]!r} failed on a worker:\n{value}")
+                yield index, value
+        finally:
+            # the queued tasks of a failed job, or of a uimap which is not read to the end, are skipped
+            self._cancelled.add(job)
+            self._results.pop(job, None)
+
+    def uimap(self, function, iterable, chunksize=None):
+        """
+        Run function on each item on the workers and yield the results as they finish.
+
+        The chunksize is accepted for compatibility with pathos, tasks are sent one by one.
+        """
+        for _, value in self._run(function, iterable):
+            yield value
+
+    def map(self, function, iterable, chunksize=None):
+        """
+        Run function on each item on the workers and return the results in the order of the items.
+        """
+        results = dict(self._run(function, iterable))
+        return [results[index] for index in range(len(results))]
+
+    def close(self):
+        """
+        Stop the workers and the coordinator.
+        """
+        self._closed.set()
+        self._server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def start_local_workers(pool, number_of_workers=2):
+    """
+    Start workers on localhost for a coordinator, e.g. for testing.
+
+    Args:
+        pool (ClusterPool): The coordinator.
+        number_of_workers (int, optional): The number of workers. Defaults to 2.
+
+    Returns:
+        list: The worker processes, which stop when the coordinator is closed.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, AUTHKEY_ENV: pool.authkey}
+    return [
+        subprocess.Popen(
+            [sys.executable, os.path.join(directory, "sim_cluster.py"), "127.0.0.1", str(pool.port)],
+            cwd=directory,
+            env=env,
+        )
+        for _ in range(number_of_workers)
+    ]
+
+
+# ------------------------------------------------------------
+# worker
+# ------------------------------------------------------------
+def run_worker(host, port, authkey=None):
+    """
+    Connect to a coordinator and run its tasks until it stops.
+
+    Args:
+        host (str): The address of the coordinator.
+        port (int): The port of the coordinator.
+        authkey (str, optional): The shared key. Defaults to the SIM_CLUSTER_AUTHKEY environment variable.
+    """
+    authkey = authkey or os.environ[AUTHKEY_ENV]
+    with socket.create_connection((host, port)) as sock:
+        send_bytes(sock, authkey.encode())
+        while True:
+            try:
+                command, function, item = recv_frame(sock)
+            except (OSError, EOFError):
+                break
+            if command == "stop":
+                break
+            try:
+                message = ("ok", function(item))
+            except Exception:
+                message = ("error", traceback.format_exc())
+            send_frame(sock, message)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run sweep tasks for a ClusterPool coordinator.")
+    parser.add_argument("host", help="address of the coordinator")
+    parser.add_argument("port", type=int, help="port of the coordinator")
+    args = parser.parse_args()
+    run_worker(args.host, args.port)
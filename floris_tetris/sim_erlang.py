@@ -0,0 +1,214 @@
+# Description: exact M/M/c results with the Erlang B and C formulas
+
+import numpy as np
+import pandas as pd
+import salabim as sim
+from scipy.special import gammaln, logsumexp
+
+from sim_analysis import get_mean_with_ci
+
+# minutes per hour, the rates are per hour and the times in minutes as in sim_facility
+cnv_hr_to_mins = 60
+
+
+# ------------------------------------------------------------
+# Erlang B and C
+# ------------------------------------------------------------
+def erlang_b(c, a):
+    """
+    Blocking probability of the Erlang B formula, with the stable recursion
+    B(0) = 1, B(k) = a B(k-1) / (k + a B(k-1)), which does not overflow for large c.
+
+    Args:
+        c (int or array): The number of servers.
+        a (float or array): The offered load lambda / mu in Erlang.
+
+    Returns:
+        float or numpy.ndarray: The blocking probability, an array if c or a is one.
+    """
+    if np.ndim(c) == 0 and np.ndim(a) == 0:
+        # the number of servers may be a float, e.g. read from a DataFrame
+        if c != int(c):
+            raise ValueError(f"the number of servers must be a whole number, not {c}")
+        b = 1.0
+        for k in range(1, int(c) + 1):
+            b = a * b / (k + a * b)
+        return b
+
+    # one recursion for all designs, each stops at its own number of servers
+    c, a = np.broadcast_arrays(np.asarray(c), np.asarray(a, dtype=float))
+    b = np.ones(c.shape)
+    for k in range(1, int(c.max(initial=0)) + 1):
+        b = np.where(k <= c, a * b / (k + a * b), b)
+    return b
+
+
+def erlang_c(c, a):
+    """
+    Probability of waiting of the Erlang C formula, 1 if the queue is not stable (a >= c).
+
+    Args:
+        c (int or array): The number of servers.
+        a (float or array): The offered load lambda / mu in Erlang.
+
+    Returns:
+        float or numpy.ndarray: The probability that an arrival has to wait.
+    """
+    if np.ndim(c) == 0 and np.ndim(a) == 0:
+        if a >= c:
+            return 1.0
+        b = erlang_b(c, a)
+        return c * b / (c - a * (1 - b))
+
+    b = erlang_b(c, a)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(a >= c, 1.0, c * b / (c - a * (1 - b)))
+
+
+def log_p0(c, a):
+    """
+    Logarithm of the probability of an empty M/M/c system, evaluated in log-space.
+
+    1 / P0 = sum_{n<c} a^n / n! + a^c / (c! (1 - a / c))
+
+    Args:
+        c (int): The number of servers.
+        a (float): The offered load lambda / mu in Erlang, below c.
+
+    Returns:
+        float: log(P0).
+    """
+    n = np.arange(c)
+    log_terms = np.append(
+        n * np.log(a) - gammaln(n + 1),
+        c * np.log(a) - gammaln(c + 1) - np.log1p(-a / c),
+    )
+    return -logsumexp(log_terms)
+
+
+# ------------------------------------------------------------
+# M/M/c results in the schema of sim_facility
+# ------------------------------------------------------------
+def mmc(lmbda, mu, number_of_EVSE, run=0):
+    """
+    Exact steady state results of an M/M/c queue.
+
+    Args:
+        lmbda (float): The arrival rate per hour.
+        mu (float): The service rate of an EVSE per hour.
+        number_of_EVSE (int): The number of EVSE's.
+        run (int, optional): The run number of the row. Defaults to 0.
+
+    Returns:
+        dict: The row with the columns of sim_facility and Pw, the probability of waiting.
+            The times Wq and Ws are in minutes. If the queue is not stable, the queue
+            lengths and times are inf.
+    """
+    c = number_of_EVSE
+    a = lmbda / mu
+    rho = a / c
+
+    if rho >= 1:
+        P0, Pw, Lq, Wq = 0.0, 1.0, np.inf, np.inf
+    else:
+        P0 = float(np.exp(log_p0(c, a)))
+        Pw = erlang_c(c, a)
+        Lq = Pw * rho / (1 - rho)
+        Wq = Lq / lmbda * cnv_hr_to_mins
+
+    return {
+        "run": run,
+        "lambda": lmbda,
+        "mu": mu,
+        "c": c,
+        "RO": rho,
+        "P0": P0,
+        "Lq": Lq,
+        "Wq": Wq,
+        "Ls": Lq + a,
+        "Ws": Wq + cnv_hr_to_mins / mu,
+        "Pw": Pw,
+    }
+
+
+def facility_rates(inter_arr_time_distr, energy_request_distr, number_of_EVSE, fixed_utilization=False):
+    """
+    Return the arrival and service rate per hour of a facility, as sim_facility reports them.
+    """
+    lmbda = cnv_hr_to_mins / inter_arr_time_distr.mean()
+    if fixed_utilization:
+        lmbda = lmbda * number_of_EVSE
+    return lmbda, cnv_hr_to_mins / energy_request_distr.mean()
+
+
+def is_exponential(distr):
+    """
+    Whether a salabim or scipy distribution is exponential, so the facility is exactly M/M/c.
+    """
+    distr = getattr(distr, "distr", distr)  # BufferedSampler
+    if isinstance(distr, sim.Exponential):
+        return True
+    if isinstance(distr, (sim.Erlang, sim.Gamma)):
+        return distr._shape == 1
+    if hasattr(distr, "dist"):
+        # frozen scipy distribution, exponential if it starts at 0 and its std equals its mean
+        return (
+            distr.dist.name in ("expon", "gamma")
+            and distr.support()[0] == 0
+            and np.isclose(distr.std(), distr.mean())
+        )
+    return False
+
+
+def mmc_for_range_of_EVSE(inter_arr_time_distr, energy_request_distr, range_of_EVSE, fixed_utilization=False):
+    """
+    Exact M/M/c results for a range of EVSE's, with the same distributions as sim_facility_for_range_of_EVSE.
+
+    Only the means of the distributions are used, so the results are exact only if both
+    are exponential, see is_exponential.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution, in minutes.
+        energy_request_distr: The energy request distribution, in minutes.
+        range_of_EVSE (range): The numbers of EVSE's.
+        fixed_utilization (bool, optional): Whether the arrivals scale with the number of EVSE's. Defaults to False.
+
+    Returns:
+        pandas.DataFrame: One row per number of EVSE's.
+    """
+    return pd.DataFrame(
+        [
+            mmc(*facility_rates(inter_arr_time_distr, energy_request_distr, c, fixed_utilization), c)
+            for c in range_of_EVSE
+        ]
+    )
+
+
+def validate_with_mmc(df_sim, inter_arr_time_distr, energy_request_distr, fixed_utilization=False, metrics=("Lq", "Wq", "Ls", "Ws")):
+    """
+    Compare simulation results of an M/M/c facility with the exact results.
+
+    Args:
+        df_sim (DataFrame): The simulation results, or their merged sufficient statistics.
+        inter_arr_time_distr: The inter-arrival time distribution of the simulation.
+        energy_request_distr: The energy request distribution of the simulation.
+        fixed_utilization (bool, optional): Whether the arrivals scale with the number of EVSE's. Defaults to False.
+        metrics (tuple, optional): The metrics to compare. Defaults to ("Lq", "Wq", "Ls", "Ws").
+
+    Returns:
+        DataFrame: The confidence intervals of get_mean_with_ci with the exact value and
+            whether it is inside the interval.
+    """
+    if not (is_exponential(inter_arr_time_distr) and is_exponential(energy_request_distr)):
+        raise ValueError("the exact results are only valid for exponential distributions")
+
+    df_ci = get_mean_with_ci(df_sim)
+    df_ci = df_ci[df_ci["name"].isin(metrics)]
+    df_exact = (
+        mmc_for_range_of_EVSE(inter_arr_time_distr, energy_request_distr, df_ci["c"].unique(), fixed_utilization)
+        .melt(id_vars="c", value_vars=list(metrics), var_name="name", value_name="exact")
+    )
+    return (
+        df_ci.merge(df_exact, on=["c", "name"], how="left")
+        .assign(within_ci=lambda df: (df["lbnd"] <= df["exact"]) & (df["exact"] <= df["ubnd"]))
+    )
@@ -1,6 +1,11 @@
 import salabim as sim
-from datetime import datetime
 import pandas as pd
+import numpy as np
+import heapq
+from collections import deque
+
+from sim_sampler import BLOCK_SIZE, BufferedSampler, buffered_distributions, needs_substreams, salabim_seed
+from sim_analysis import mser
 
 # ------------------------------------------------------------
 # Simulation code for M/M/c queue
@@ -15,6 +20,14 @@ def sim_facility(
     time_unit="minutes",
     random_seed='*',
     run=1,
+    engine="salabim",
+    block_size=None,
+    streaming=False,
+    warmup=None,
+    number_of_batches=None,
+    common_random_numbers=False,
+    antithetic=None,
+    ev_tokens=False,
 ):
     """
     Simulate a charging facility for electric vehicles.
@@ -27,10 +40,66 @@ def sim_facility(
         time_unit (str, optional): The time unit used in the simulation. Defaults to "minutes".
         random_seed (int, optional): The random seed for reproducibility. Defaults to 123456.
         run (int, optional): The run number of the simulation. Defaults to 1.
+        engine (str, optional): "salabim" runs the discrete event model, "vectorized" computes
+            the FIFO waiting times with the Kiefer-Wolfowitz recursion. Defaults to "salabim".
+        block_size (int, optional): If given, the variates are drawn in blocks of this size
+            from a numpy Generator instead of one by one. Defaults to None.
+        streaming (bool, optional): If True, the EVSE's tally into shared stats only monitors
+            with constant memory instead of keeping a full monitor each. Defaults to False.
+        warmup (str, optional): If "mser5", the warm-up period is determined with MSER-5 on the
+            waiting times and discarded from the statistics. Defaults to None.
+        number_of_batches (int, optional): If given, the run (after the warm-up) is split in this
+            number of equal batches, with the batch number as run. Defaults to None.
+        common_random_numbers (bool, optional): If True, the inter-arrival times and energy requests
+            are drawn from dedicated substreams of random_seed, so runs with the same seed see the
+            same EV's whatever the number of EVSE's. Defaults to False.
+        antithetic (bool, optional): False or True for the two runs of an antithetic pair, which draw
+            from the substreams of random_seed with U and 1 - U. Defaults to None, no antithetic pair.
+        ev_tokens (bool, optional): If True, the waiting EV's are lightweight tokens in a slotted
+            waiting line instead of salabim components, which is faster and gives the same
+            results. Defaults to False.
 
     Returns:
-        dict: A dictionary containing the simulation results including aggregate statistics.
+        dict: A dictionary containing the simulation results including aggregate statistics,
+            or a list with such a dictionary per batch if number_of_batches is given. The
+            sample means of the inter-arrival times (iat) and the charging times (service)
+            are the control variates of sim_analysis.
     """
+    if engine == "vectorized":
+        return sim_facility_vectorized(
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            number_of_EVSE=number_of_EVSE,
+            sim_time=sim_time,
+            fixed_utilization=fixed_utilization,
+            random_seed=random_seed,
+            run=run,
+            block_size=block_size,
+            warmup=warmup,
+            number_of_batches=number_of_batches,
+            common_random_numbers=common_random_numbers,
+            antithetic=antithetic,
+        )
+    elif engine != "salabim":
+        raise ValueError(f"unknown engine '{engine}', use 'salabim' or 'vectorized'")
+    if warmup not in (None, "mser5"):
+        raise ValueError(f"unknown warmup '{warmup}', use None or 'mser5'")
+    # the warm-up detection and the batches need the full history of the monitors
+    full_history = warmup is not None or number_of_batches is not None
+    if full_history and streaming:
+        raise ValueError("warmup and batches need the full monitors, they can not be combined with streaming")
+
+    if needs_substreams(random_seed, common_random_numbers, antithetic) and block_size is None:
+        block_size = BLOCK_SIZE
+    if block_size is not None:
+        inter_arr_time_distr, energy_request_distr = buffered_distributions(
+            inter_arr_time_distr,
+            energy_request_distr,
+            random_seed=random_seed,
+            block_size=block_size,
+            antithetic=antithetic,
+        )
+
     # ------------------------------------------------------------
     cnv_hr_to_mins = 60
 
@@ -45,11 +114,18 @@ def sim_facility(
 
         def process(self):
             while True:
-                EV()
+                if ev_tokens:
+                    waitingline.append(EVToken(app.now()))
+                    if idle_facility:
+                        idle_facility.pop().activate()  # activate at most one charging station
+                else:
+                    EV()
                 iat = inter_arr_time_distr.sample()
                 if fixed_utilization:
                     iat = iat/number_of_EVSE
                 self.hold(iat)
+                # tallied when the gap ends, so a period holds the gaps which end in it
+                arrival_iat.tally(iat)
 
     class EV(sim.Component):
         def setup(self):
@@ -58,10 +134,8 @@ def sim_facility(
 
         def process(self):
             self.enter(waitingline)
-            for EVSE in facility:
-                if EVSE.ispassive():
-                    EVSE.activate()
-                    break  # activate at most one charging station
+            if idle_facility:
+                idle_facility.pop().activate()  # activate at most one charging station
             self.passivate()
 
     class EVSE(sim.Component):
@@ -69,15 +143,20 @@ def sim_facility(
             self.mode.monitor(False)
             self.status.monitor(False)
 
-            self.length = sim.Monitor(
-                name="length", monitor=True, level=True, type="int32"
-            )
-            self.length_of_stay = sim.Monitor(
-                name="length_of_stay", monitor=True, level=False, type="float"
-            )
-            self.power_mon = sim.Monitor(
-                name="power.", monitor=True, level=True, type="float"
-            )
+            if streaming:
+                self.length = LevelShare(facility_length)
+                self.length_of_stay = facility_length_of_stay
+                self.power_mon = LevelShare(facility_power)
+            else:
+                self.length = sim.Monitor(
+                    name="length", monitor=True, level=True, type="int32"
+                )
+                self.length_of_stay = sim.Monitor(
+                    name="length_of_stay", monitor=True, level=False, type="float"
+                )
+                self.power_mon = sim.Monitor(
+                    name="power.", monitor=True, level=True, type="float"
+                )
             self.power = 1.0
 
         def process(self):
@@ -85,6 +164,7 @@ def sim_facility(
                 self.length.tally(0)
                 while len(waitingline) == 0:
                     self.set_mode("Waiting")
+                    idle_facility.append(self)
                     self.passivate()
                 self.car = waitingline.pop()
                 self.length.tally(1)
@@ -96,38 +176,71 @@ def sim_facility(
                 self.power_mon.tally(self.power)
                 self.set_mode("Charging")
                 self.hold(charging_time)
-                self.car.activate()
+                if not ev_tokens:
+                    self.car.activate()
 
     # ------------------------------------------------------------
     # https://www.salabim.org/manual/Reference.html#environment
     app = sim.App(
         trace=False,  # defines whether to trace or not
-        random_seed=random_seed,  # if “*”, a purely random value (based on the current time)
+        random_seed=salabim_seed(random_seed),  # if “*”, a purely random value (based on the current time)
         time_unit=time_unit,  # defines the time unit used in the simulation
         name="Charging Station",  # name of the simulation
         do_reset=True,  # defines whether to reset the simulation when the run method is called
         yieldless=True,  # defines whether the simulation is yieldless or not
     )
 
+    # the sampled inter-arrival times, a control variate with a known mean
+    arrival_iat = sim.Monitor(name="iat", level=False, stats_only=not full_history)
+
     # Instantiate and activate the client generator
     EV_Generator(name="Electric Vehicles Generator")
 
     # Create Queue and set monitor to stats_only
     # https://www.salabim.org/manual/Queue.html
-    waitingline = sim.Queue(name="Waiting EV's", monitor=True)
-    # waitingline.length_of_stay.monitor(value=True)
-    waitingline.length.reset_monitors(stats_only=True)
-    waitingline.length_of_stay.reset_monitors(stats_only=True)
+    if ev_tokens:
+        waitingline = TokenLine(name="Waiting EV's", env=app, stats_only=not full_history)
+    else:
+        waitingline = sim.Queue(name="Waiting EV's", monitor=True)
+        # waitingline.length_of_stay.monitor(value=True)
+        waitingline.length.reset_monitors(stats_only=not full_history)
+        waitingline.length_of_stay.reset_monitors(stats_only=not full_history)
+
+    # Monitors shared by all EVSE's, which only keep running statistics
+    if streaming:
+        facility_length = sim.Monitor(
+            name="length", level=True, initial_tally=0, stats_only=True
+        )
+        facility_length_of_stay = sim.Monitor(
+            name="length_of_stay", level=False, stats_only=True
+        )
+        facility_power = sim.Monitor(
+            name="power.", level=True, initial_tally=0, stats_only=True
+        )
 
     # Instantiate the EVSE's, list comprehension
+    # idle EVSE's put themselves on a stack, so an arriving EV finds one in O(1)
+    idle_facility = []
     facility = [EVSE() for _ in range(number_of_EVSE)]
 
     # Execute Simulation
     app.run(till=sim_time)
 
     # Calculate aggregate statistics
-    total_evse_stay = sum(x.length_of_stay for x in facility).mean()
-    total_evse_lngt = sum(x.length for x in facility).mean()
+    if streaming:
+        evse_stay = facility_length_of_stay
+        evse_lngt = facility_length
+    else:
+        evse_stay = sum(x.length_of_stay for x in facility)
+        evse_lngt = sum(x.length for x in facility)
+
+    # discard the warm-up period, which ends when the first retained EV leaves the queue
+    warmup_time = 0
+    if warmup is not None:
+        times, waits = waitingline.length_of_stay.tx()
+        d = mser(waits)
+        if d > 0:
+            warmup_time = times[d]
 
     # waitingline.mode.print_histogram(values=True)
 
@@ -136,16 +249,549 @@ def sim_facility(
     if fixed_utilization:
         lmbda = lmbda*number_of_EVSE
 
+    def period_results(start, stop, run):
+        monitors = [evse_stay, evse_lngt, waitingline.length, waitingline.length_of_stay, arrival_iat]
+        if start > 0 or stop < sim_time:
+            monitors = [monitor.slice(start, stop) for monitor in monitors]
+        total_evse_stay, total_evse_lngt, queue_length, queue_stay, mean_iat = [
+            monitor.mean() for monitor in monitors
+        ]
+
+        return {
+            "run": run,
+            "lambda": lmbda,
+            "mu": cnv_hr_to_mins/energy_request_distr.mean(),
+            "c": number_of_EVSE,
+            "RO": total_evse_lngt / number_of_EVSE,
+            "P0": 0,
+            "Lq": queue_length,
+            "Wq": queue_stay,
+            "Ls": total_evse_lngt + queue_length,
+            "Ws": total_evse_stay + queue_stay,
+            "iat": mean_iat,
+            "service": total_evse_stay,
+        }
+
     # Return results
+    if number_of_batches is None:
+        results = period_results(warmup_time, sim_time, run)
+        if warmup is not None:
+            results["warmup"] = warmup_time
+        return results
+
+    # batch means, the batch number is the run
+    batch_length = (sim_time - warmup_time) / number_of_batches
+    batches = []
+    for k in range(number_of_batches):
+        start = warmup_time + k * batch_length
+        results = period_results(start, start + batch_length, k)
+        if warmup is not None:
+            results["warmup"] = warmup_time
+        batches.append(results)
+    return batches
+
+
+# ------------------------------------------------------------
+# Lightweight EV's and their waiting line
+# ------------------------------------------------------------
+class EVToken:
+    """
+    An EV as a plain record with its arrival time, instead of a salabim component.
+    """
+
+    __slots__ = ("arrival",)
+
+    def __init__(self, arrival):
+        self.arrival = arrival
+
+
+class TokenLine:
+    """
+    FIFO waiting line of EVTokens with the length and length_of_stay monitors of a sim.Queue.
+
+    Args:
+        name (str): The name of the waiting line.
+        env (sim.Environment): The simulation environment.
+        stats_only (bool, optional): Whether the monitors only keep running statistics. Defaults to True.
+    """
+
+    def __init__(self, name, env, stats_only=True):
+        self.env = env
+        self._tokens = deque()
+        self.length = sim.Monitor(
+            name=f"Length of {name}", level=True, initial_tally=0, type="uint32", stats_only=stats_only
+        )
+        self.length_of_stay = sim.Monitor(
+            name=f"Length of stay in {name}", level=False, stats_only=stats_only
+        )
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def append(self, token):
+        self._tokens.append(token)
+        self.length.tally(len(self._tokens))
+
+    def pop(self):
+        token = self._tokens.popleft()
+        self.length.tally(len(self._tokens))
+        self.length_of_stay.tally(self.env.now() - token.arrival)
+        return token
+
+
+# ------------------------------------------------------------
+# Level of one component in a level monitor shared by many
+# ------------------------------------------------------------
+class LevelShare:
+    """
+    The share of one component in a level monitor which holds the sum of the levels of many.
+
+    Tallying a new level adds the change with respect to the previous level of this
+    component to the shared monitor, so the shared monitor can be stats only.
+
+    Args:
+        monitor (sim.Monitor): The shared level monitor, with an initial tally of 0.
+    """
+
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.value = 0
+
+    def tally(self, value):
+        self.monitor.tally(self.monitor.get() + value - self.value)
+        self.value = value
+
+
+# ------------------------------------------------------------
+# Vectorized engine for G/G/c FIFO queue
+# ------------------------------------------------------------
+def sample_array(distr, size):
+    """
+    Draw a number of variates from a distribution at once.
+
+    Args:
+        distr: The (salabim) distribution to sample from.
+        size (int): The number of variates.
+
+    Returns:
+        numpy.ndarray: The sampled variates.
+    """
+    if isinstance(distr, BufferedSampler):
+        return distr.draw(size)
+    return np.fromiter((distr.sample() for _ in range(size)), dtype=float, count=size)
+
+
+def sample_arrivals(inter_arr_time_distr, sim_time, scale=1.0):
+    """
+    Sample the arrival times of the EV's in [0, sim_time).
+
+    The first EV arrives at time 0, like the EV_Generator of the salabim model.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        sim_time (float): The simulation time.
+        scale (float, optional): Factor applied to every inter-arrival time. Defaults to 1.0.
+
+    Returns:
+        numpy.ndarray: The arrival times.
+    """
+    # sample in blocks of the expected number of arrivals until sim_time is passed
+    block = int(sim_time / (inter_arr_time_distr.mean() * scale)) + 100
+    iats = []
+    total = 0.0
+    while total < sim_time:
+        iat = sample_array(inter_arr_time_distr, block) * scale
+        iats.append(iat)
+        total += iat.sum()
+    arrival = np.concatenate(([0.0], np.cumsum(np.concatenate(iats))))
+    return arrival[arrival < sim_time]
+
+
+def kiefer_wolfowitz(arrival, service, number_of_EVSE):
+    """
+    Compute the service start times of a FIFO queue with c parallel servers.
+
+    The heap holds the times at which each EVSE becomes free, which is the
+    Kiefer-Wolfowitz workload vector shifted by the arrival time of the EV.
+
+    Args:
+        arrival (numpy.ndarray): The (sorted) arrival times.
+        service (numpy.ndarray): The service (charging) times.
+        number_of_EVSE (int): The number of EVSE's.
+
+    Returns:
+        numpy.ndarray: The service start times.
+    """
+    free = [0.0] * number_of_EVSE
+    start = []
+    for t, s in zip(arrival.tolist(), service.tolist()):
+        b = free[0] if free[0] > t else t
+        start.append(b)
+        heapq.heapreplace(free, b + s)
+    return np.array(start)
+
+
+def kiefer_wolfowitz_batch(arrival, service, number_of_EVSE):
+    """
+    Compute the service start times of many replications of a FIFO queue in lockstep.
+
+    Every row is a replication, the EV's of all rows are processed together so the
+    recursion runs on (replications x EVSE's) arrays. Rows can be padded at the end
+    with an arrival time of inf, which gives a start time of inf.
+
+    Args:
+        arrival (numpy.ndarray): The (sorted) arrival times, replications x EV's.
+        service (numpy.ndarray): The service (charging) times, replications x EV's.
+        number_of_EVSE (int): The number of EVSE's.
+
+    Returns:
+        numpy.ndarray: The service start times, replications x EV's.
+    """
+    reps, n = arrival.shape
+    rows = np.arange(reps)
+    free = np.zeros((reps, number_of_EVSE))
+    start = np.empty((reps, n))
+    for k in range(n):
+        # the EVSE that becomes free first serves the next EV
+        j = free.argmin(axis=1)
+        b = np.maximum(free[rows, j], arrival[:, k])
+        start[:, k] = b
+        free[rows, j] = b + service[:, k]
+    return start
+
+
+def queue_statistics(arrival, start, service, sim_time, warmup_time=0.0):
+    """
+    Calculate the time-average and per-EV statistics of a queue over [warmup_time, sim_time].
+
+    With an earlier sim_time the statistics are those of a period within a longer run.
+
+    Works on single runs and on (replications x EV's) arrays padded with inf arrivals,
+    the statistics are taken over the last axis.
+
+    Args:
+        arrival (numpy.ndarray): The arrival times.
+        start (numpy.ndarray): The service start times.
+        service (numpy.ndarray): The service (charging) times.
+        sim_time (float): The simulation time.
+        warmup_time (float, optional): The end of the warm-up period, an array with one
+            value per row for (replications x EV's) arrays. Defaults to 0.0.
+
+    Returns:
+        dict: Mean number in queue (Lq), mean number charging (busy), mean waiting time (Wq),
+            mean charging time (service) and mean inter-arrival time (iat).
+    """
+    warmup_time = np.asarray(warmup_time, dtype=float)
+    duration = sim_time - warmup_time
+    if warmup_time.ndim > 0:
+        # one warm-up time per replication
+        warmup_time = warmup_time[:, np.newaxis]
+
+    # only EV's that started charging in the period are tallied
+    served = (start <= sim_time) & (start >= warmup_time)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        in_queue = np.where(
+            arrival < sim_time,
+            np.minimum(start, sim_time) - np.maximum(arrival, warmup_time),
+            0.0,
+        )
+        in_service = np.where(
+            start <= sim_time,
+            np.minimum(start + service, sim_time) - np.maximum(start, warmup_time),
+            0.0,
+        )
+        wait = np.where(served, start - arrival, 0.0)
+        # the inter-arrival times which end in the period, as the salabim model tallies them
+        gap = arrival[..., 1:] - arrival[..., :-1]
+        gapped = (arrival[..., 1:] >= warmup_time) & (arrival[..., 1:] < sim_time)
+        iat = np.where(gapped, gap, 0.0).sum(axis=-1) / gapped.sum(axis=-1)
+    number_served = served.sum(axis=-1)
     return {
+        "Lq": np.maximum(in_queue, 0.0).sum(axis=-1) / duration,
+        "busy": np.maximum(in_service, 0.0).sum(axis=-1) / duration,
+        "Wq": wait.sum(axis=-1) / number_served,
+        "service": np.where(served, service, 0.0).sum(axis=-1) / number_served,
+        "iat": iat,
+    }
+
+
+def sample_customers(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    fixed_utilization=False,
+    random_seed='*',
+    block_size=None,
+    common_random_numbers=False,
+    antithetic=None,
+):
+    """
+    Sample the arrival and charging times of all EV's of one run.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        energy_request_distr: The energy request distribution.
+        number_of_EVSE (int): The number of EVSE's.
+        sim_time (int): The simulation time.
+        fixed_utilization (bool, optional): Whether to scale the arrivals with the number of EVSE's. Defaults to False.
+        random_seed (int, optional): The random seed for reproducibility. Defaults to '*'.
+        block_size (int, optional): If given, sample in blocks from a numpy Generator. Defaults to None.
+        common_random_numbers (bool, optional): If True, sample from dedicated substreams of random_seed. Defaults to False.
+        antithetic (bool, optional): False or True for the two runs of an antithetic pair. Defaults to None.
+
+    Returns:
+        tuple: The arrival times and the charging times.
+    """
+    power = 1.0
+
+    sim.random_seed(salabim_seed(random_seed))
+    if needs_substreams(random_seed, common_random_numbers, antithetic) and block_size is None:
+        block_size = BLOCK_SIZE
+    if block_size is not None:
+        inter_arr_time_distr, energy_request_distr = buffered_distributions(
+            inter_arr_time_distr,
+            energy_request_distr,
+            random_seed=random_seed,
+            block_size=block_size,
+            antithetic=antithetic,
+        )
+
+    scale = 1 / number_of_EVSE if fixed_utilization else 1.0
+    arrival = sample_arrivals(inter_arr_time_distr, sim_time, scale)
+    service = sample_array(energy_request_distr, len(arrival)) / power
+    return arrival, service
+
+
+def mser_warmup_time(arrival, start, sim_time):
+    """
+    Determine the end of the warm-up period of one run with MSER-5 on the waiting times.
+
+    The waiting times are in FIFO order, the warm-up ends when the first retained EV
+    starts charging, like the tally time of the salabim waiting line.
+
+    Args:
+        arrival (numpy.ndarray): The arrival times.
+        start (numpy.ndarray): The service start times.
+        sim_time (float): The simulation time.
+
+    Returns:
+        float: The end of the warm-up period.
+    """
+    served = start <= sim_time
+    d = mser(start[served] - arrival[served])
+    return float(start[served][d]) if d > 0 else 0.0
+
+
+def facility_results(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    fixed_utilization,
+    stats,
+    run,
+    warmup_time=None,
+):
+    """
+    Build the result dict of sim_facility from the queue statistics of one run.
+    """
+    cnv_hr_to_mins = 60
+
+    lmbda = cnv_hr_to_mins / inter_arr_time_distr.mean()
+    if fixed_utilization:
+        lmbda = lmbda * number_of_EVSE
+
+    results = {
         "run": run,
         "lambda": lmbda,
-        "mu": cnv_hr_to_mins/energy_request_distr.mean(),
+        "mu": cnv_hr_to_mins / energy_request_distr.mean(),
         "c": number_of_EVSE,
-        "RO": total_evse_lngt / number_of_EVSE,
+        "RO": float(stats["busy"]) / number_of_EVSE,
         "P0": 0,
-        "Lq": waitingline.length.mean(),
-        "Wq": waitingline.length_of_stay.mean(),
-        "Ls": total_evse_lngt + waitingline.length.mean(),
-        "Ws": total_evse_stay + waitingline.length_of_stay.mean(),
+        "Lq": float(stats["Lq"]),
+        "Wq": float(stats["Wq"]),
+        "Ls": float(stats["busy"] + stats["Lq"]),
+        "Ws": float(stats["service"] + stats["Wq"]),
+        "iat": float(stats["iat"]),
+        "service": float(stats["service"]),
     }
+    if warmup_time is not None:
+        results["warmup"] = float(warmup_time)
+    return results
+
+
+def sim_facility_vectorized(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    fixed_utilization=False,
+    random_seed='*',
+    run=1,
+    block_size=None,
+    warmup=None,
+    number_of_batches=None,
+    common_random_numbers=False,
+    antithetic=None,
+):
+    """
+    Simulate a charging facility for electric vehicles without salabim components.
+
+    All inter-arrival times and energy requests are sampled up front and the
+    FIFO waiting times follow from the Kiefer-Wolfowitz recursion.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        energy_request_distr: The energy request distribution.
+        number_of_EVSE (int): The number of EVSE's.
+        sim_time (int): The simulation time.
+        fixed_utilization (bool, optional): Whether to scale the arrivals with the number of EVSE's. Defaults to False.
+        random_seed (int, optional): The random seed for reproducibility. Defaults to '*'.
+        run (int, optional): The run number of the simulation. Defaults to 1.
+        block_size (int, optional): If given, sample in blocks from a numpy Generator. Defaults to None.
+        warmup (str, optional): If "mser5", discard the warm-up period found with MSER-5. Defaults to None.
+        number_of_batches (int, optional): If given, return the results of this number of equal
+            batches of the run. Defaults to None.
+        common_random_numbers (bool, optional): If True, sample from dedicated substreams of random_seed. Defaults to False.
+        antithetic (bool, optional): False or True for the two runs of an antithetic pair. Defaults to None.
+
+    Returns:
+        dict: A dictionary with the same results as sim_facility, or a list of them per batch.
+    """
+    if warmup not in (None, "mser5"):
+        raise ValueError(f"unknown warmup '{warmup}', use None or 'mser5'")
+
+    arrival, service = sample_customers(
+        inter_arr_time_distr,
+        energy_request_distr,
+        number_of_EVSE,
+        sim_time,
+        fixed_utilization,
+        random_seed,
+        block_size,
+        common_random_numbers,
+        antithetic,
+    )
+    start = kiefer_wolfowitz(arrival, service, number_of_EVSE)
+
+    warmup_time = None
+    if warmup is not None:
+        warmup_time = mser_warmup_time(arrival, start, sim_time)
+
+    if number_of_batches is None:
+        stats = queue_statistics(arrival, start, service, sim_time, warmup_time or 0.0)
+        return facility_results(
+            inter_arr_time_distr,
+            energy_request_distr,
+            number_of_EVSE,
+            fixed_utilization,
+            stats,
+            run,
+            warmup_time,
+        )
+
+    # batch means, the batch number is the run
+    bounds = np.linspace(warmup_time or 0.0, sim_time, number_of_batches + 1)
+    return [
+        facility_results(
+            inter_arr_time_distr,
+            energy_request_distr,
+            number_of_EVSE,
+            fixed_utilization,
+            queue_statistics(arrival, start, service, bounds[k + 1], bounds[k]),
+            k,
+            warmup_time,
+        )
+        for k in range(number_of_batches)
+    ]
+
+
+def sim_facility_batch(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    fixed_utilization=False,
+    random_seeds=(0,),
+    runs=None,
+    block_size=None,
+    warmup=None,
+    common_random_numbers=False,
+):
+    """
+    Simulate many replications of a charging facility at once.
+
+    The replications are the rows of (replications x EV's) arrays which are processed
+    in lockstep by kiefer_wolfowitz_batch. Replication i gives the same results as
+    sim_facility(engine="vectorized", random_seed=random_seeds[i]). The warm-up period is
+    found with MSER-5 on the average waiting times over all replications, and discarded
+    from the same number of EV's in each replication.
+
+    Args:
+        inter_arr_time_distr: The inter-arrival time distribution.
+        energy_request_distr: The energy request distribution.
+        number_of_EVSE (int): The number of EVSE's.
+        sim_time (int): The simulation time.
+        fixed_utilization (bool, optional): Whether to scale the arrivals with the number of EVSE's. Defaults to False.
+        random_seeds (list, optional): One random seed per replication. Defaults to (0,).
+        runs (list, optional): The run numbers of the replications. Defaults to the random seeds.
+        block_size (int, optional): If given, sample in blocks from a numpy Generator. Defaults to None.
+        warmup (str, optional): If "mser5", discard the warm-up period found with MSER-5 on the
+            average over the replications. Defaults to None.
+        common_random_numbers (bool, optional): If True, sample from dedicated substreams of the seeds. Defaults to False.
+
+    Returns:
+        list: A list with a result dict per replication.
+    """
+    if warmup not in (None, "mser5"):
+        raise ValueError(f"unknown warmup '{warmup}', use None or 'mser5'")
+    if runs is None:
+        runs = random_seeds
+
+    customers = [
+        sample_customers(
+            inter_arr_time_distr,
+            energy_request_distr,
+            number_of_EVSE,
+            sim_time,
+            fixed_utilization,
+            seed,
+            block_size,
+            common_random_numbers,
+        )
+        for seed in random_seeds
+    ]
+
+    # pad the rows to the same number of EV's, padded EV's never arrive
+    n = max(len(arrival) for arrival, _ in customers)
+    arrival = np.full((len(customers), n), np.inf)
+    service = np.zeros((len(customers), n))
+    for i, (a, s) in enumerate(customers):
+        arrival[i, : len(a)] = a
+        service[i, : len(s)] = s
+
+    start = kiefer_wolfowitz_batch(arrival, service, number_of_EVSE)
+
+    # MSER-5 on the average over the replications of the waiting time of the k-th EV,
+    # which is far less sensitive to the excursions of a single run (Welch's method)
+    warmup_times = [None] * len(customers)
+    if warmup is not None:
+        n = (start <= sim_time).sum(axis=1).min()
+        d = mser((start[:, :n] - arrival[:, :n]).mean(axis=0))
+        warmup_times = start[:, d].tolist() if d > 0 else [0.0] * len(customers)
+    stats = queue_statistics(
+        arrival, start, service, sim_time, [t or 0.0 for t in warmup_times]
+    )
+
+    return [
+        facility_results(
+            inter_arr_time_distr,
+            energy_request_distr,
+            number_of_EVSE,
+            fixed_utilization,
+            {key: value[i] for key, value in stats.items()},
+            run,
+            warmup_times[i],
+        )
+        for i, run in enumerate(runs)
+    ]
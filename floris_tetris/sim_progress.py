@@ -0,0 +1,173 @@
+# Description: progress and throughput of simulation sweeps
+
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# events per EV: arrival, start and end of charging
+EVENTS_PER_EV = 3
+
+
+# ------------------------------------------------------------
+# timing of a task, in the worker
+# ------------------------------------------------------------
+def timed_task(task_function, task):
+    """
+    Run a task and measure it.
+
+    Args:
+        task_function: The function to run the task.
+        task: The task, e.g. (c, replication).
+
+    Returns:
+        tuple: The task, its result and a dict with the worker and its start and end time.
+    """
+    start = time.time()
+    result = task_function(task)
+    return task, result, {"worker": os.getpid(), "start": start, "end": time.time()}
+
+
+def run_totals(sim_runs):
+    """
+    Return the number of runs and the sum of their arrival rates.
+
+    Args:
+        sim_runs (list): The results of the runs, or their sufficient statistics.
+
+    Returns:
+        tuple: The number of runs and the sum of lambda.
+    """
+    # sufficient statistics, see sim_analysis.sufficient_statistics
+    if sim_runs and "sumsq" in sim_runs[0]:
+        lambdas = [s for s in sim_runs if s["name"] == "lambda"]
+        return sum(s["n"] for s in lambdas), sum(s["sum"] for s in lambdas)
+    return len(sim_runs), sum(sim_run["lambda"] for sim_run in sim_runs)
+
+
+# ------------------------------------------------------------
+# progress of a sweep, in the main process
+# ------------------------------------------------------------
+class SweepProgress:
+    """
+    Record the progress and throughput of the tasks of a sweep.
+
+    Each finished task gets a record with its wall time, the estimated number of simulated
+    events per second, the worker that ran it, the number of pending tasks and the ETA of
+    the sweep. The records can be exported with to_frame and summarized per worker with
+    worker_utilization, e.g. to see whether a slow sweep waits for one large-c straggler.
+
+    Args:
+        verbose (bool, optional): Whether to print a line per finished task. Defaults to False.
+    """
+
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.records = []
+        self.begin()
+
+    def begin(self, total=None, sim_time=None):
+        """
+        Start a sweep, the records of an earlier sweep are dropped.
+
+        Args:
+            total (int, optional): The number of tasks, None if unknown. Defaults to None.
+            sim_time (float, optional): The simulation time of a run in minutes, used to
+                estimate the number of events. Defaults to None.
+        """
+        self.total = total
+        self.sim_time = sim_time
+        self.records = []
+        self.start = time.time()
+
+    def task_done(self, task, sim_runs, stats):
+        """
+        Record a finished task.
+
+        Args:
+            task: The task, (c, replication).
+            sim_runs (list): The results of the runs of the task.
+            stats (dict): The worker, start and end of the task, see timed_task.
+        """
+        c, replication = task
+        wall_time = stats["end"] - stats["start"]
+        runs, total_lambda = run_totals(sim_runs)
+        events = (
+            EVENTS_PER_EV * total_lambda * self.sim_time / 60
+            if self.sim_time is not None
+            else float("nan")
+        )
+
+        done = len(self.records) + 1
+        elapsed = time.time() - self.start
+        pending = None if self.total is None else self.total - done
+        eta = None if pending is None else elapsed / done * pending
+
+        self.records.append(
+            {
+                "c": c,
+                "replication": replication,
+                "runs": runs,
+                "worker": stats["worker"],
+                "start": stats["start"] - self.start,
+                "end": stats["end"] - self.start,
+                "wall_time": wall_time,
+                "events": events,
+                "events_per_sec": events / wall_time if wall_time > 0 else float("nan"),
+                "pending": pending,
+                "eta": eta,
+            }
+        )
+
+        if self.verbose:
+            print(
+                f"EVSE's {c}"
+                + ("" if replication is None else f", replication {replication}")
+                + f" completed at {datetime.now()}: "
+                f"{wall_time:.2f} s, {self.records[-1]['events_per_sec']:,.0f} events/s"
+                + ("" if pending is None else f", {pending} pending, ETA {timedelta(seconds=round(eta))}")
+            )
+
+    def to_frame(self):
+        """
+        Return the records of the finished tasks.
+
+        Returns:
+            pandas.DataFrame: One row per task, times in seconds since the start of the sweep.
+        """
+        return pd.DataFrame(
+            self.records,
+            columns=[
+                "c",
+                "replication",
+                "runs",
+                "worker",
+                "start",
+                "end",
+                "wall_time",
+                "events",
+                "events_per_sec",
+                "pending",
+                "eta",
+            ],
+        )
+
+    def worker_utilization(self):
+        """
+        Summarize the tasks per worker.
+
+        The utilization is the fraction of the sweep a worker was running tasks, the rest of
+        the time it waited, or was pickling and sending results.
+
+        Returns:
+            pandas.DataFrame: The tasks, busy time and utilization per worker.
+        """
+        df = self.to_frame()
+        elapsed = df["end"].max() if len(df) else 0.0
+        return (
+            df.groupby("worker")
+            .agg(tasks=("wall_time", "size"), busy=("wall_time", "sum"))
+            .assign(utilization=lambda d: d["busy"] / elapsed if elapsed > 0 else float("nan"))
+            .reset_index()
+        )
@@ -3,14 +3,162 @@
 
 # https://stackoverflow.com/questions/8804830/python-multiprocessing-picklingerror-cant-pickle-type-function
 from pathos.multiprocessing import ProcessingPool as Pool
+from functools import partial
+import json
+import os
+import time
 
 from sim_facility import *
+from sim_analysis import (
+    SIM_METRICS,
+    merge_statistics,
+    pair_average,
+    relative_half_width,
+    sufficient_statistics,
+    write_sim_results,
+)
+from sim_sampler import distribution_params
+from sim_cache import cached_sim_facility
+from sim_progress import SweepProgress, timed_task
+
+# ------------------------------------------------------------
+# seed of a replication, spawned from one root seed
+# ------------------------------------------------------------
+
+
+def replication_spawn_key(number_of_EVSE, replication, common_random_numbers=False, stream=None):
+    """
+    Return the spawn key of the seed of a replication.
+
+    The key is (c, i) for replication i with c EVSE's, so every (c, i) gets its own
+    independent seed. With common random numbers the key is (i,), so replication i
+    sees the same EVs for every number of EVSE's.
+
+    Parameters:
+    number_of_EVSE (int): The number of EVSEs.
+    replication (int): The replication.
+    common_random_numbers (bool, optional): Whether to share the seed over the numbers of EVSEs. Defaults to False.
+    stream (int, optional): Used instead of number_of_EVSE, e.g. the scenario of a sweep. Defaults to None.
+
+    Returns:
+    tuple: The spawn key.
+    """
+    if common_random_numbers:
+        return (replication,)
+    return (number_of_EVSE if stream is None else stream, replication)
+
+
+def replication_seed(root_seed, spawn_key):
+    """
+    Return the SeedSequence with the given spawn key of root_seed, the same as
+    SeedSequence(root_seed).spawn() would give, independent of the order of the runs.
+    """
+    return np.random.SeedSequence(root_seed, spawn_key=tuple(int(k) for k in spawn_key))
+
+
+def format_spawn_key(spawn_key):
+    return ":".join(str(k) for k in spawn_key)
+
+
+# ------------------------------------------------------------
+# function to run one replication for one number of EVSE's
+# ------------------------------------------------------------
+
+
+# returns a list with the result of the run, or of both runs of an antithetic pair
+def sim_facility_replication(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    fixed_utilization,
+    replication,
+    common_random_numbers=False,
+    antithetic=False,
+    cache_dir=None,
+    root_seed=None,
+    stream=None,
+):
+    """
+    Simulate replication i of the facility, with random seed i or a seed spawned from root_seed.
+
+    Parameters:
+    inter_arr_time_distr: The inter-arrival time distribution.
+    energy_request_distr: The energy request distribution.
+    number_of_EVSE (int): The number of EVSEs.
+    sim_time (int): The simulation time.
+    fixed_utilization (bool): Whether to use fixed utilization or not.
+    replication (int): The replication, which is the run, or with antithetic the pair.
+    common_random_numbers (bool, optional): If True, draw the EVs from dedicated substreams. Defaults to False.
+    antithetic (bool, optional): If True, the replication is the antithetic pair of runs 2i and 2i+1. Defaults to False.
+    cache_dir (str, optional): If given, reuse the results of earlier runs stored in this directory. Defaults to None.
+    root_seed (int, optional): If given, the seed is spawned from this root seed with the key of
+        replication_spawn_key, which is stored in the 'spawn_key' column. Defaults to None.
+    stream (int, optional): Used instead of number_of_EVSE in the spawn key. Defaults to None.
+
+    Returns:
+    list: The results of the run, or of both runs of the pair.
+    """
+    # run through the cache if a cache directory is given
+    facility = sim_facility if cache_dir is None else partial(cached_sim_facility, cache_dir=cache_dir)
+
+    if root_seed is None:
+        random_seed = replication
+    else:
+        spawn_key = replication_spawn_key(number_of_EVSE, replication, common_random_numbers, stream)
+        random_seed = replication_seed(root_seed, spawn_key)
+
+    if not antithetic:
+        sim_runs = [
+            facility(
+                inter_arr_time_distr=inter_arr_time_distr,
+                energy_request_distr=energy_request_distr,
+                number_of_EVSE=number_of_EVSE,
+                sim_time=sim_time,
+                fixed_utilization=fixed_utilization,
+                random_seed=random_seed,
+                run=replication,
+                common_random_numbers=common_random_numbers,
+            )
+        ]
+    else:
+        # both runs of the pair use the seed of the pair
+        sim_runs = []
+        for member in (False, True):
+            sim_run = facility(
+                inter_arr_time_distr=inter_arr_time_distr,
+                energy_request_distr=energy_request_distr,
+                number_of_EVSE=number_of_EVSE,
+                sim_time=sim_time,
+                fixed_utilization=fixed_utilization,
+                random_seed=random_seed,
+                run=2 * replication + member,
+                antithetic=member,
+            )
+            sim_run["pair"] = replication
+            sim_runs.append(sim_run)
+
+    if root_seed is not None:
+        for sim_run in sim_runs:
+            sim_run["spawn_key"] = format_spawn_key(spawn_key)
+    return sim_runs
+
 
 # ------------------------------------------------------------
 # function to run simulation X times per EVSE for all EVSE's
 # ------------------------------------------------------------
 
 
+def check_batch_means(batch_means, antithetic, rel_precision):
+    """
+    Raise a ValueError for options which can not be combined with batch means.
+    """
+    if batch_means and antithetic:
+        raise ValueError("batch means make one long run, they can not be combined with antithetic pairs")
+    if batch_means and rel_precision is not None:
+        raise ValueError("batch means have a fixed number of batches, they can not be combined with rel_precision")
+
+
 # returns a DataFrame with the results
 def sim_facility_with_c_EVSE(
     inter_arr_time_distr,
@@ -20,6 +168,15 @@ def sim_facility_with_c_EVSE(
     fixed_utilization,
     number_of_simulations,
     verbose=False,
+    rel_precision=None,
+    metrics=("Wq", "Lq"),
+    max_simulations=1000,
+    batch_means=False,
+    common_random_numbers=False,
+    antithetic=False,
+    cache_dir=None,
+    progress=None,
+    root_seed=None,
 ):
     """
     Simulate the facility with multiple runs using different random seeds.
@@ -30,34 +187,357 @@ def sim_facility_with_c_EVSE(
     number_of_EVSE (int, optional): The number of EVSEs. Defaults to 1.
     sim_time (int, optional): The simulation time. Defaults to 50000.
     number_of_simulations (int, optional): The number of simulations to run. Defaults to 30.
+        With rel_precision this is the minimum number of simulations.
     verbose (bool, optional): Whether to print verbose output. Defaults to False.
+    rel_precision (float, optional): If given, keep adding simulations until the half-width of the
+        95% confidence interval of all metrics is below this fraction of their mean. Defaults to None.
+    metrics (tuple, optional): The columns for rel_precision. Defaults to ("Wq", "Lq").
+    max_simulations (int, optional): The maximum number of simulations with rel_precision. Defaults to 1000.
+    batch_means (bool, optional): If True, make one long run which is split in number_of_simulations
+        batches, each batch is a row of the result. Defaults to False.
+    common_random_numbers (bool, optional): If True, run i gets the same EVs for every number of EVSEs,
+        from dedicated substreams of seed i for arrivals and energy requests. Defaults to False.
+    antithetic (bool, optional): If True, the runs are antithetic pairs, run 2p and 2p+1 use U and 1 - U
+        of seed p and share the value p in the 'pair' column. Defaults to False.
+    cache_dir (str, optional): If given, reuse the results of earlier runs stored in this directory,
+        see sim_cache.cached_sim_facility. Defaults to None.
+    progress (SweepProgress, optional): Records the wall time and throughput of each replication,
+        a new one which prints if verbose is True by default. Defaults to None.
+    root_seed (int, optional): If given, the seed of run i is spawned from this root seed with
+        key (c, i), or (i,) with common_random_numbers, instead of seed i. Defaults to None.
 
     Returns:
     pandas.DataFrame: A DataFrame containing the results of all simulations.
     """
+    check_batch_means(batch_means, antithetic, rel_precision)
+    if progress is None:
+        progress = SweepProgress(verbose=verbose)
+
+    if batch_means:
+        progress.begin(total=1, sim_time=sim_time / number_of_simulations)
+        facility = sim_facility if cache_dir is None else partial(cached_sim_facility, cache_dir=cache_dir)
+        if root_seed is None:
+            random_seed = 0
+        else:
+            spawn_key = replication_spawn_key(number_of_EVSE, 0, common_random_numbers)
+            random_seed = replication_seed(root_seed, spawn_key)
+        start = time.time()
+        sim_runs = facility(
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            number_of_EVSE=number_of_EVSE,
+            sim_time=sim_time,
+            fixed_utilization=fixed_utilization,
+            random_seed=random_seed,
+            number_of_batches=number_of_simulations,
+            common_random_numbers=common_random_numbers,
+        )
+        if root_seed is not None:
+            for sim_run in sim_runs:
+                sim_run["spawn_key"] = format_spawn_key(spawn_key)
+        progress.task_done(
+            (number_of_EVSE, None), sim_runs, {"worker": os.getpid(), "start": start, "end": time.time()}
+        )
+        return pd.DataFrame(sim_runs)
+
     # Create empty list to store results
     sim_runs = []
 
+    # the number of replications is unknown when simulating until rel_precision is reached
+    replications = (number_of_simulations + 1) // 2 if antithetic else number_of_simulations
+    progress.begin(total=None if rel_precision is not None else replications, sim_time=sim_time)
+
     # Run simulation X times with different random seeds for same number of EVSE's
-    for i in range(number_of_simulations):
-        sim_runs.append(
-            sim_facility(
-                inter_arr_time_distr=inter_arr_time_distr,
-                energy_request_distr=energy_request_distr,
-                number_of_EVSE=number_of_EVSE,
-                sim_time=sim_time,
-                fixed_utilization=fixed_utilization,
-                random_seed=i,
-                run=i,
-            )
+    i = 0
+    while True:
+        # an antithetic pair adds two runs
+        start = time.time()
+        sim_run = sim_facility_replication(
+            inter_arr_time_distr,
+            energy_request_distr,
+            number_of_EVSE,
+            sim_time,
+            fixed_utilization,
+            i // 2 if antithetic else i,
+            common_random_numbers,
+            antithetic,
+            cache_dir,
+            root_seed,
+        )
+        progress.task_done(
+            (number_of_EVSE, i // 2 if antithetic else i),
+            sim_run,
+            {"worker": os.getpid(), "start": start, "end": time.time()},
         )
-        if verbose:
-            print(f"EVSE's {number_of_EVSE}, run {i} completed at {datetime.now()}")
+        sim_runs.extend(sim_run)
+        i += 2 if antithetic else 1
+
+        if i < number_of_simulations:
+            continue
+        if rel_precision is None or i >= max_simulations:
+            break
+
+        # stop when the confidence intervals of all metrics are narrow enough
+        df = pd.DataFrame(sim_runs)
+        if antithetic:
+            df = pair_average(df)
+        if all(relative_half_width(df, col) <= rel_precision for col in metrics):
+            break
+
+    # Concatenate all runs
+    return pd.DataFrame(sim_runs)
+
+
+# returns a DataFrame with the results
+# all runs are simulated at once in a (runs x EV's) array
+def sim_facility_with_c_EVSE_batch(
+    inter_arr_time_distr,
+    energy_request_distr,
+    number_of_EVSE,
+    sim_time,
+    fixed_utilization,
+    number_of_simulations,
+    verbose=False,
+    warmup=None,
+    common_random_numbers=False,
+    root_seed=None,
+    progress=None,
+):
+    """
+    Simulate the facility with multiple runs in lockstep using different random seeds.
+
+    Parameters:
+    inter_arr_time_distr: The inter-arrival time distribution.
+    energy_request_distr: The energy request distribution.
+    number_of_EVSE (int): The number of EVSEs.
+    sim_time (int): The simulation time.
+    fixed_utilization (bool): Whether to use fixed utilization or not.
+    number_of_simulations (int): The number of simulations to run.
+    verbose (bool, optional): Whether to print verbose output. Defaults to False.
+    warmup (str, optional): If "mser5", discard the warm-up period found with MSER-5. Defaults to None.
+    common_random_numbers (bool, optional): If True, run i gets the same EVs for every number of EVSEs. Defaults to False.
+    root_seed (int, optional): If given, the seeds are spawned from this root seed, see
+        replication_spawn_key. Defaults to None.
+    progress (SweepProgress, optional): Records the wall time and throughput of the lockstep runs as
+        one task, a new one which prints if verbose is True by default. Defaults to None.
+
+    Returns:
+    pandas.DataFrame: A DataFrame containing the results of all simulations.
+    """
+    if progress is None:
+        progress = SweepProgress(verbose=verbose)
+    progress.begin(total=1, sim_time=sim_time)
+
+    if root_seed is None:
+        random_seeds = range(number_of_simulations)
+    else:
+        spawn_keys = [
+            replication_spawn_key(number_of_EVSE, i, common_random_numbers)
+            for i in range(number_of_simulations)
+        ]
+        random_seeds = [replication_seed(root_seed, spawn_key) for spawn_key in spawn_keys]
+
+    start = time.time()
+    sim_runs = sim_facility_batch(
+        inter_arr_time_distr=inter_arr_time_distr,
+        energy_request_distr=energy_request_distr,
+        number_of_EVSE=number_of_EVSE,
+        sim_time=sim_time,
+        fixed_utilization=fixed_utilization,
+        random_seeds=random_seeds,
+        runs=range(number_of_simulations),
+        warmup=warmup,
+        common_random_numbers=common_random_numbers,
+    )
+    if root_seed is not None:
+        for sim_run, spawn_key in zip(sim_runs, spawn_keys):
+            sim_run["spawn_key"] = format_spawn_key(spawn_key)
+    progress.task_done(
+        (number_of_EVSE, None), sim_runs, {"worker": os.getpid(), "start": start, "end": time.time()}
+    )
 
     # Concatenate all runs
     return pd.DataFrame(sim_runs)
 
 
+# ------------------------------------------------------------
+# warm pool of workers, to be reused for many sweeps
+# ------------------------------------------------------------
+
+
+def warm_up_worker():
+    """
+    Import the simulation stack once, when a worker of a SimPool is started.
+    """
+    import salabim
+    import pandas
+    import scipy.stats
+    import sim_facility
+
+
+class SimPool(Pool):
+    """
+    Long-lived pool of workers for sim_facility_for_range_of_EVSE.
+
+    The workers import salabim, pandas and scipy when they are started and stay alive until
+    the pool is closed, so repeated sweeps, e.g. over utilization levels in a notebook, do
+    not pay the start-up cost again. Each SimPool has its own workers, separate from the
+    default pathos pool.
+
+    Args:
+        nodes (int, optional): The number of workers. Defaults to the number of cpu's.
+
+    Example:
+        with SimPool() as pool:
+            for ro in (0.5, 0.7, 0.9):
+                df = sim_facility_for_range_of_EVSE(..., pool=pool)
+    """
+
+    def __init__(self, nodes=None):
+        if nodes is None:
+            super().__init__(id=f"SimPool-{id(self)}", initializer=warm_up_worker)
+        else:
+            super().__init__(nodes, id=f"SimPool-{id(self)}", initializer=warm_up_worker)
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Stop the workers.
+        """
+        self.clear()
+
+
+# ------------------------------------------------------------
+# tasks for the pool, module level functions are pickled by reference
+# ------------------------------------------------------------
+
+
+# a task is (c, replication), the replication is None for all runs of c at once
+# each task returns the list of its runs
+def sim_facility_with_c_EVSE_task(task, **kwargs):
+    c, _ = task
+    return sim_facility_with_c_EVSE(number_of_EVSE=c, **kwargs).to_dict("records")
+
+
+def sim_facility_replication_task(task, **kwargs):
+    c, i = task
+    return sim_facility_replication(number_of_EVSE=c, replication=i, **kwargs)
+
+
+def reduced_task(task_function, task):
+    return sufficient_statistics(task_function(task))
+
+
+# ------------------------------------------------------------
+# append-only checkpoint of the finished tasks
+# ------------------------------------------------------------
+
+
+def read_checkpoint(ffn_checkpoint, session):
+    """
+    Read the finished tasks from a checkpoint.
+
+    Args:
+        ffn_checkpoint (str): The full filename of the checkpoint.
+        session (dict): The parameters of the sweep, which must match those in the checkpoint.
+
+    Returns:
+        dict: The runs of each finished task (c, replication).
+    """
+    done = {}
+    if not os.path.exists(ffn_checkpoint):
+        return done
+    with open(ffn_checkpoint) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of a run that was killed while writing
+                continue
+            if "session" in record:
+                if record["session"] != session:
+                    raise ValueError(
+                        f"checkpoint {ffn_checkpoint} is of a sweep with other parameters"
+                    )
+                continue
+            done[(record["c"], record["replication"])] = record["runs"]
+    return done
+
+
+def run_tasks(
+    p, task_function, tasks, chunksize, progress, sim_time, ffn_checkpoint=None, session=None, merge=None
+):
+    """
+    Run the tasks in the pool and record each one when it is finished.
+
+    With a checkpoint, only the tasks which are not in the checkpoint yet are run and each
+    result is appended to it when it is finished.
+
+    Args:
+        p: The pool of workers.
+        task_function: The function to run a task (c, replication).
+        tasks (list): The tasks.
+        chunksize (int): The number of tasks sent to a worker at once.
+        progress (SweepProgress): Records the progress of the tasks.
+        sim_time (float): The simulation time of a run, to estimate the number of events.
+        ffn_checkpoint (str, optional): The full filename of the checkpoint. Defaults to None.
+        session (dict, optional): The parameters of the sweep, for the checkpoint. Defaults to None.
+        merge (optional): If given, each result is passed to merge when it is finished, instead
+            of being kept. Defaults to None.
+
+    Returns:
+        list: The runs of each task, in the order of tasks, or None with merge.
+    """
+    done = {}
+    f = None
+    if ffn_checkpoint is not None:
+        # the session in the file is compared with the session after a round trip to json
+        session = json.loads(json.dumps(session))
+        done = read_checkpoint(ffn_checkpoint, session)
+
+        f = open(ffn_checkpoint, "a+")
+        # complete the line of a run that was killed while writing
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(f.tell() - 1)
+            if f.read(1) != "\n":
+                f.write("\n")
+        if f.tell() == 0:
+            f.write(json.dumps({"session": session}) + "\n")
+            f.flush()
+
+    todo = [task for task in tasks if task not in done]
+    progress.begin(total=len(todo), sim_time=sim_time)
+    if merge is not None:
+        for task in tasks:
+            if task in done:
+                merge(done.pop(task))
+
+    try:
+        for (c, i), sim_runs, stats in p.uimap(partial(timed_task, task_function), todo, chunksize=chunksize):
+            if f is not None:
+                f.write(
+                    json.dumps(
+                        {"c": c, "replication": i, "runs": sim_runs},
+                        default=lambda x: x.item(),
+                    )
+                    + "\n"
+                )
+                f.flush()
+            if merge is None:
+                done[(c, i)] = sim_runs
+            else:
+                merge(sim_runs)
+            progress.task_done((c, i), sim_runs, stats)
+    finally:
+        if f is not None:
+            f.close()
+
+    return None if merge is not None else [done[task] for task in tasks]
+
+
 # ------------------------------------------------------------
 # function to run simulation X times per EVSE for all EVSE's
 # ------------------------------------------------------------
@@ -74,6 +554,18 @@ def sim_facility_for_range_of_EVSE(
     number_of_simulations,
     ffn_results=None,
     verbose=False,
+    rel_precision=None,
+    metrics=("Wq", "Lq"),
+    max_simulations=1000,
+    batch_means=False,
+    common_random_numbers=False,
+    antithetic=False,
+    pool=None,
+    ffn_checkpoint=None,
+    cache_dir=None,
+    progress=None,
+    root_seed=None,
+    reduce=False,
 ):
     """
     Simulates the facility for different numbers of EVSEs and returns the concatenated results.
@@ -85,29 +577,142 @@ def sim_facility_for_range_of_EVSE(
     - sim_time (int, optional): The simulation time in seconds. Defaults to 50000.
     - number_of_simulations (int, optional): The number of simulations to run. Defaults to 30.
     - fixed_utilization (bool, optional): Whether to use fixed utilization or not. Defaults to True.
+    - ffn_results (str, optional): If given, save the results to this file, as parquet or feather if
+      the extension is .parquet or .feather and as csv otherwise. Defaults to None.
     - verbose (bool, optional): Whether to print verbose output or not. Defaults to False.
+    - rel_precision (float, optional): If given, simulate each number of EVSEs until the relative
+      half-width of the confidence interval of the metrics is below it. Defaults to None.
+    - metrics (tuple, optional): The columns for rel_precision. Defaults to ("Wq", "Lq").
+    - max_simulations (int, optional): The maximum number of simulations with rel_precision. Defaults to 1000.
+    - batch_means (bool, optional): If True, make one long run per number of EVSEs, split in
+      number_of_simulations batches. Defaults to False.
+    - common_random_numbers (bool, optional): If True, run i sees the same EVs for every number of
+      EVSEs, which reduces the variance of the differences between them. Defaults to False.
+    - antithetic (bool, optional): If True, run the simulations in antithetic pairs. Defaults to False.
+    - pool (SimPool, optional): A warm pool to run the simulations, which can be reused for
+      many sweeps, or a sim_cluster.ClusterPool to run them on other machines. Defaults to the
+      default pathos pool.
+    - ffn_checkpoint (str, optional): If given, append each finished task to this file and skip the
+      tasks which are already in it, so an interrupted sweep can be resumed, see
+      sim_setup.create_ffn_checkpoint. Defaults to None.
+    - cache_dir (str, optional): If given, reuse the runs of earlier sweeps with the same parameters and
+      seeds stored in this directory, e.g. sim_cache.CACHE_DIR. Defaults to None.
+    - progress (SweepProgress, optional): Records the wall time, throughput, worker and ETA of each
+      task, see SweepProgress.to_frame. Defaults to a new one, which prints if verbose is True.
+    - root_seed (int, optional): If given, the seed of every (c, replication) is spawned from this
+      root seed, which makes the sweep reproducible whatever the workers or the order of the
+      tasks, and the spawn key is stored in the 'spawn_key' column. Defaults to seed i for run i.
+    - reduce (bool, optional): If True, the workers return the count, sum, sum of squares, minimum
+      and maximum of each metric, which are merged when they arrive, instead of the runs. This
+      keeps the memory independent of the number of runs. Defaults to False.
 
     Returns:
-    - pandas.DataFrame: The concatenated results of all simulations.
+    - pandas.DataFrame: The concatenated results of all simulations, or with reduce the merged
+      statistics per 'c' and metric, which get_sim_summary accepts too.
     """
 
-    def sim_facility_with_c_EVSE_wrapper(c):
-        # Call the original function with all the arguments
-        return sim_facility_with_c_EVSE(
-            inter_arr_time_distr,
-            energy_request_distr,
-            c,
-            sim_time,
-            fixed_utilization,
-            number_of_simulations,
-            verbose,
+    check_batch_means(batch_means, antithetic, rel_precision)
+
+    # the default pathos pool, unless a warm pool is given
+    p = Pool() if pool is None else pool
+
+    if rel_precision is not None or batch_means:
+        # the runs of one number of EVSE's depend on each other, one task per number of EVSE's
+        tasks = [(c, None) for c in sorted(range_of_EVSE, reverse=True)]
+        task_function = partial(
+            sim_facility_with_c_EVSE_task,
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            sim_time=sim_time,
+            fixed_utilization=fixed_utilization,
+            number_of_simulations=number_of_simulations,
+            # the batches are reported as one task by the progress of the sweep
+            verbose=verbose and not batch_means,
+            rel_precision=rel_precision,
+            metrics=metrics,
+            max_simulations=max_simulations,
+            batch_means=batch_means,
+            common_random_numbers=common_random_numbers,
+            antithetic=antithetic,
+            cache_dir=cache_dir,
+            root_seed=root_seed,
+        )
+        chunksize = 1
+    else:
+        # one task per (c, replication), an antithetic pair is one replication
+        replications = (number_of_simulations + 1) // 2 if antithetic else number_of_simulations
+        # largest number of EVSE's first, these have the most events with fixed utilization
+        tasks = [(c, i) for c in sorted(range_of_EVSE, reverse=True) for i in range(replications)]
+        task_function = partial(
+            sim_facility_replication_task,
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            sim_time=sim_time,
+            fixed_utilization=fixed_utilization,
+            common_random_numbers=common_random_numbers,
+            antithetic=antithetic,
+            cache_dir=cache_dir,
+            root_seed=root_seed,
         )
-    
-    # Create a pool of workers
-    with Pool() as p:
-        results = p.map(sim_facility_with_c_EVSE_wrapper, range_of_EVSE)
+        # a few chunks per worker keeps them busy until the end
+        chunksize = max(1, len(tasks) // (4 * p.ncpus))
+
+    session = None
+    if ffn_checkpoint is not None:
+        # the parameters that determine the results of a task
+        session = {
+            "inter_arr_time_distr": distribution_params(inter_arr_time_distr),
+            "energy_request_distr": distribution_params(energy_request_distr),
+            "sim_time": sim_time,
+            "fixed_utilization": fixed_utilization,
+            "rel_precision": rel_precision,
+            "metrics": metrics,
+            "max_simulations": max_simulations,
+            "batch_means": batch_means,
+            "common_random_numbers": common_random_numbers,
+            "antithetic": antithetic,
+            "root_seed": root_seed,
+            "reduce": reduce,
+        }
+        if tasks[0][1] is None:
+            session["number_of_simulations"] = number_of_simulations
+
+    if progress is None:
+        progress = SweepProgress(verbose=verbose)
 
-    df_total = pd.concat(results)
+    # merge the statistics of each task when it arrives
+    total = {}
+    if reduce:
+        task_function = partial(reduced_task, task_function)
+
+    results = run_tasks(
+        p,
+        task_function,
+        tasks,
+        chunksize,
+        progress,
+        # a batch of batch means is a part of the run
+        sim_time / number_of_simulations if batch_means else sim_time,
+        ffn_checkpoint,
+        session,
+        partial(merge_statistics, total) if reduce else None,
+    )
+
+    if reduce:
+        # the statistics in the order of range_of_EVSE and the metrics
+        df_total = pd.DataFrame(
+            [total[(c, name)] for c in range_of_EVSE for name in SIM_METRICS if (c, name) in total]
+        )
+    else:
+        # reassemble one DataFrame per number of EVSE's, in the order of range_of_EVSE
+        df_total = pd.concat(
+            [
+                pd.DataFrame(
+                    [sim_run for (d, _), runs in zip(tasks, results) if d == c for sim_run in runs]
+                )
+                for c in range_of_EVSE
+            ]
+        )
 
     # # Initialize an empty list
     # dfs = []
@@ -133,15 +738,8 @@ def sim_facility_for_range_of_EVSE(
     # df_total = pd.concat(dfs, axis =0, ignore_index=True)
 
     if ffn_results is not None:
-        # save results of simulation
-        df_total.to_csv(
-            path_or_buf=ffn_results,
-            sep=";",
-            index=False,
-            header=True,
-            decimal=".",
-            float_format="%.3f",
-        )
+        # save results of simulation, as csv, parquet or feather
+        write_sim_results(df_total, ffn_results)
 
     return df_total
 
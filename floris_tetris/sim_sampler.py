@@ -0,0 +1,324 @@
+# Description: block-buffered random variates for the simulation distributions
+
+import salabim as sim
+import numpy as np
+import scipy.stats as st
+
+# default number of variates drawn at once
+BLOCK_SIZE = 50_000
+
+
+# ------------------------------------------------------------
+# draw a block of variates with a numpy Generator
+# ------------------------------------------------------------
+def draw_block(distr, rng, size):
+    """
+    Draw a block of variates from a salabim or scipy distribution with a numpy Generator.
+
+    Distributions without a numpy counterpart are sampled one by one with their own sample method.
+
+    Args:
+        distr: The salabim distribution or frozen scipy distribution.
+        rng (numpy.random.Generator): The generator to draw from.
+        size (int): The number of variates.
+
+    Returns:
+        numpy.ndarray: The variates.
+    """
+    # frozen scipy.stats distribution, e.g. the gamma fit of the energy requests
+    if hasattr(distr, "rvs"):
+        return np.asarray(distr.rvs(size=size, random_state=rng), dtype=float)
+
+    f = getattr(distr, "time_unit_factor", 1)
+    if isinstance(distr, sim.Exponential):
+        return rng.exponential(distr._mean, size) * f
+    if isinstance(distr, sim.Uniform):
+        return rng.uniform(distr._lowerbound, distr._upperbound, size) * f
+    if isinstance(distr, sim.Erlang):
+        # note: salabim divides the Erlang by the time unit factor
+        return rng.gamma(distr._shape, 1 / distr._rate, size) / f
+    if isinstance(distr, sim.Gamma):
+        return rng.gamma(distr._shape, distr._scale, size) * f
+    if isinstance(distr, sim.Constant):
+        return np.full(size, distr._value * f, dtype=float)
+    if isinstance(distr, sim.Normal):
+        return rng.normal(distr._mean, distr._standard_deviation, size) * f
+    if isinstance(distr, sim.Triangular):
+        return rng.triangular(distr._low, distr._mode, distr._high, size) * f
+    if isinstance(distr, sim.Weibull):
+        return distr._scale * rng.weibull(distr._shape, size) * f
+
+    return np.fromiter((distr.sample() for _ in range(size)), dtype=float, count=size)
+
+
+# ------------------------------------------------------------
+# inverse transform, used for antithetic variates
+# ------------------------------------------------------------
+def inverse_transform(distr, u):
+    """
+    Transform uniform variates to variates of a salabim or scipy distribution with its inverse cdf.
+
+    Args:
+        distr: The salabim distribution or frozen scipy distribution.
+        u (numpy.ndarray): Uniform variates on [0, 1).
+
+    Returns:
+        numpy.ndarray: The variates.
+    """
+    if hasattr(distr, "ppf"):
+        return np.asarray(distr.ppf(u), dtype=float)
+
+    f = getattr(distr, "time_unit_factor", 1)
+    if isinstance(distr, sim.Exponential):
+        return -distr._mean * np.log1p(-u) * f
+    if isinstance(distr, sim.Uniform):
+        return (distr._lowerbound + (distr._upperbound - distr._lowerbound) * u) * f
+    if isinstance(distr, sim.Erlang):
+        return st.gamma.ppf(u, distr._shape, scale=1 / distr._rate) / f
+    if isinstance(distr, sim.Gamma):
+        return st.gamma.ppf(u, distr._shape, scale=distr._scale) * f
+    if isinstance(distr, sim.Constant):
+        return np.full(len(u), distr._value * f, dtype=float)
+    if isinstance(distr, sim.Normal):
+        return st.norm.ppf(u, distr._mean, distr._standard_deviation) * f
+    if isinstance(distr, sim.Triangular):
+        c = (distr._mode - distr._low) / (distr._high - distr._low)
+        return st.triang.ppf(u, c, loc=distr._low, scale=distr._high - distr._low) * f
+    if isinstance(distr, sim.Weibull):
+        return distr._scale * (-np.log1p(-u)) ** (1 / distr._shape) * f
+
+    raise ValueError(f"no inverse transform for {type(distr).__name__}")
+
+
+# ------------------------------------------------------------
+# sampler which serves the block one variate at a time
+# ------------------------------------------------------------
+class BufferedSampler:
+    """
+    Drop-in replacement for a distribution which draws its variates in blocks.
+
+    The sampler has the sample and mean methods of a salabim distribution and
+    can be called like the generators of create_random_generator.
+
+    Args:
+        distr: The salabim distribution or frozen scipy distribution.
+        rng (numpy.random.Generator, optional): The generator to draw from. Defaults to a fresh generator.
+        block_size (int, optional): The number of variates drawn at once. Defaults to BLOCK_SIZE.
+        antithetic (bool, optional): None to use the numpy method of the distribution, False to use
+            the inverse transform of uniform variates U and True to use that of 1 - U. Defaults to None.
+    """
+
+    def __init__(self, distr, rng=None, block_size=BLOCK_SIZE, antithetic=None):
+        self.distr = distr
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.block_size = block_size
+        self.antithetic = antithetic
+        self._block = []
+        self._index = 0
+
+    def _draw_block(self, size):
+        if self.antithetic is None:
+            return draw_block(self.distr, self.rng, size)
+        u = self.rng.random(size)
+        if self.antithetic:
+            u = 1.0 - u
+        return inverse_transform(self.distr, u)
+
+    def __call__(self):
+        return self.sample()
+
+    def sample(self):
+        if self._index >= len(self._block):
+            # tolist gives python floats, which are faster to serve than numpy scalars
+            self._block = self._draw_block(self.block_size).tolist()
+            self._index = 0
+        x = self._block[self._index]
+        self._index += 1
+        return x
+
+    def draw(self, size):
+        """
+        Return the next size variates as an array.
+        """
+        rest = np.asarray(self._block[self._index :], dtype=float)[:size]
+        self._index += len(rest)
+        if len(rest) == size:
+            return rest
+        return np.concatenate((rest, self._draw_block(size - len(rest))))
+
+    def mean(self):
+        return self.distr.mean()
+
+
+def buffered_sampler(distr, rng=None, block_size=BLOCK_SIZE):
+    """
+    Wrap a distribution, or the bound sample method of one, in a BufferedSampler.
+
+    Objects that are already buffered or are no distribution are returned unchanged.
+
+    Args:
+        distr: The distribution, its sample method or a random generator function.
+        rng (numpy.random.Generator, optional): The generator to draw from. Defaults to a fresh generator.
+        block_size (int, optional): The number of variates drawn at once. Defaults to BLOCK_SIZE.
+
+    Returns:
+        The BufferedSampler, or distr itself.
+    """
+    if isinstance(distr, BufferedSampler):
+        return distr
+    # bound method, e.g. sim.Exponential(5).sample
+    owner = getattr(distr, "__self__", None)
+    if owner is not None and getattr(distr, "__name__", "") in ("sample", "rvs"):
+        distr = owner
+    if hasattr(distr, "rvs") or (hasattr(distr, "sample") and hasattr(distr, "mean")):
+        return BufferedSampler(distr, rng, block_size)
+    return distr
+
+
+def seed_sequence(random_seed="*"):
+    """
+    Convert a random seed to a numpy SeedSequence.
+
+    Args:
+        random_seed: An int, a SeedSequence or "*" for fresh entropy. Defaults to "*".
+
+    Returns:
+        numpy.random.SeedSequence: The seed sequence.
+    """
+    if isinstance(random_seed, np.random.SeedSequence):
+        return random_seed
+    return np.random.SeedSequence(None if random_seed == "*" else random_seed)
+
+
+def salabim_seed(random_seed):
+    """
+    Return a seed for sim.App or sim.random_seed, which do not accept a SeedSequence.
+
+    A SeedSequence is reduced to one 32-bit int, so among many spawned seeds some collide,
+    e.g. about one in 100,000 replications. The variates of a run with a SeedSequence are
+    therefore drawn from its full-entropy substreams instead, see needs_substreams.
+    """
+    if isinstance(random_seed, np.random.SeedSequence):
+        return int(random_seed.generate_state(1)[0])
+    return random_seed
+
+
+def needs_substreams(random_seed, common_random_numbers=False, antithetic=None):
+    """
+    Whether the variates of a run must be drawn from the substreams of random_seed.
+
+    That is the case for common random numbers, antithetic runs and spawned SeedSequences,
+    which would lose their entropy in salabim_seed.
+    """
+    return (
+        common_random_numbers
+        or antithetic is not None
+        or isinstance(random_seed, np.random.SeedSequence)
+    )
+
+
+def substreams(random_seed, n):
+    """
+    Derive n independent, reproducible random generators from one random seed.
+
+    Substream k is child k of the SeedSequence of random_seed. The children are derived
+    from the spawn key, so the same seed always gives the same substreams.
+
+    Args:
+        random_seed: An int, a SeedSequence or "*" for fresh entropy.
+        n (int): The number of substreams.
+
+    Returns:
+        list: The numpy Generators.
+    """
+    ss = seed_sequence(random_seed)
+    return [
+        np.random.default_rng(
+            np.random.SeedSequence(ss.entropy, spawn_key=ss.spawn_key + (k,))
+        )
+        for k in range(n)
+    ]
+
+
+def buffered_distributions(*distrs, random_seed="*", block_size=BLOCK_SIZE, antithetic=None):
+    """
+    Wrap distributions in BufferedSamplers, each with a dedicated substream of random_seed.
+
+    With a dedicated substream per distribution, e.g. arrivals and energy requests, the
+    k-th draw of each distribution only depends on the seed. This gives common random
+    numbers when the same seed is used for different numbers of EVSE's.
+
+    Args:
+        *distrs: The distributions.
+        random_seed (int, optional): The seed, a SeedSequence or "*" for fresh entropy. Defaults to "*".
+        block_size (int, optional): The number of variates drawn at once. Defaults to BLOCK_SIZE.
+        antithetic (bool, optional): None for the numpy methods, False and True for the two runs of
+            an antithetic pair, which use U and 1 - U of the same substreams. Defaults to None.
+
+    Returns:
+        list: The BufferedSamplers, in the order of distrs.
+    """
+    rngs = substreams(random_seed, len(distrs))
+    return [
+        BufferedSampler(distr, rng, block_size, antithetic)
+        for distr, rng in zip(distrs, rngs)
+    ]
+
+
+def distribution_params(distr):
+    """
+    Describe a salabim or scipy distribution by its type and parameters.
+
+    Args:
+        distr: The salabim distribution, frozen scipy distribution or BufferedSampler.
+
+    Returns:
+        dict: The name of the distribution and its parameters, which can be stored as json.
+    """
+    if isinstance(distr, BufferedSampler):
+        distr = distr.distr
+    if hasattr(distr, "dist"):
+        return {"distribution": distr.dist.name, "args": list(distr.args), "kwds": dict(distr.kwds)}
+    return {
+        "distribution": type(distr).__name__,
+        **{
+            k: v
+            for k, v in vars(distr).items()
+            if isinstance(v, (int, float, str)) and k != "time_unit"
+        },
+    }
+
+
+def scv(distr):
+    """
+    Return the squared coefficient of variation, variance / mean^2, of a salabim or scipy distribution.
+
+    Args:
+        distr: The salabim distribution, frozen scipy distribution or BufferedSampler.
+
+    Returns:
+        float: The squared coefficient of variation, 1 for the exponential distribution.
+    """
+    if isinstance(distr, BufferedSampler):
+        distr = distr.distr
+    if hasattr(distr, "dist"):
+        return float(distr.var() / distr.mean() ** 2)
+
+    if isinstance(distr, sim.Exponential):
+        return 1.0
+    if isinstance(distr, sim.Constant):
+        return 0.0
+    if isinstance(distr, (sim.Erlang, sim.Gamma)):
+        return 1 / distr._shape
+    if isinstance(distr, sim.Uniform):
+        low, high = distr._lowerbound, distr._upperbound
+        return (high - low) ** 2 / 12 / ((low + high) / 2) ** 2
+    if isinstance(distr, sim.Normal):
+        return (distr._standard_deviation / distr._mean) ** 2
+    if isinstance(distr, sim.Triangular):
+        a, b, c = distr._low, distr._high, distr._mode
+        return (a * a + b * b + c * c - a * b - a * c - b * c) / 18 / ((a + b + c) / 3) ** 2
+    if isinstance(distr, sim.Weibull):
+        return st.weibull_min(distr._shape).var() / st.weibull_min(distr._shape).mean() ** 2
+
+    raise ValueError(f"no squared coefficient of variation for {type(distr).__name__}")
@@ -17,7 +17,7 @@ ENEXIS_P_2 = "#DF0073"
 ENEXIS_B_0 = "#04296C"
 
 # define a session name based on parameters
-def session_name(report_no, sim_evse, sim_time, sim_reps):
+def session_name(report_no, sim_evse, sim_time, sim_reps, extension=".csv"):
     """
     Generate a simulation session name based on the given parameters.
 
@@ -26,6 +26,7 @@ def session_name(report_no, sim_evse, sim_time, sim_reps):
         sim_evse (list): The list of EVSE numbers.
         sim_time (int): The simulation time.
         sim_reps (int): The number of simulation repetitions.
+        extension (str, optional): The extension, ".csv", ".parquet" or ".feather". Defaults to ".csv".
 
     Returns:
         str: The generated simulation session name.
@@ -40,12 +41,12 @@ def session_name(report_no, sim_evse, sim_time, sim_reps):
         + str(sim_time)
         + "_reps_"
         + str(sim_reps)
-        + ".csv"
+        + extension
     )
     return sim_session_name
 
 # define a name for the simulation results
-def create_ffn_results(report_no, sim_evse, sim_time, sim_reps):
+def create_ffn_results(report_no, sim_evse, sim_time, sim_reps, extension=".csv"):
     """
     Create the full filename of the simulation results.
 
@@ -54,12 +55,27 @@ def create_ffn_results(report_no, sim_evse, sim_time, sim_reps):
         sim_evse (str): The EVSE identifier.
         sim_time (str): The simulation time.
         sim_reps (int): The number of simulation repetitions.
+        extension (str, optional): The extension, which sets the file format. Defaults to ".csv".
 
     Returns:
         str: The full filename of the simulation results.
     """
-    ffn_session_name = "./sim_results/" + session_name(report_no, sim_evse, sim_time, sim_reps)
+    ffn_session_name = "./sim_results/" + session_name(report_no, sim_evse, sim_time, sim_reps, extension)
     return ffn_session_name
 
+# define a name for the checkpoint of the simulation
+def create_ffn_checkpoint(report_no, sim_evse, sim_time, sim_reps):
+    """
+    Create the full filename of the checkpoint of the simulation results.
 
+    Args:
+        report_no (int): The report number.
+        sim_evse (str): The EVSE identifier.
+        sim_time (str): The simulation time.
+        sim_reps (int): The number of simulation repetitions.
 
+    Returns:
+        str: The full filename of the checkpoint, next to the simulation results.
+    """
+    ffn_checkpoint = create_ffn_results(report_no, sim_evse, sim_time, sim_reps).replace(".csv", ".checkpoint.jsonl")
+    return ffn_checkpoint
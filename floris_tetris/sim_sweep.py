@@ -0,0 +1,240 @@
+# Description: declarative parameter sweeps over the facility simulation
+
+import itertools
+
+import numpy as np
+import pandas as pd
+import salabim as sim
+from functools import partial
+from scipy.stats import qmc
+
+from sim_runs import Pool, sim_facility_replication
+from sim_analysis import write_sim_results
+
+# distribution families, as a function of the mean in minutes
+DISTRIBUTION_FAMILIES = {
+    "exponential": lambda mean: sim.Exponential(mean),
+    "deterministic": lambda mean: sim.Constant(mean),
+    "uniform": lambda mean: sim.Uniform(0, 2 * mean),
+    "erlang2": lambda mean: sim.Erlang(2, 2 / mean),
+    "erlang4": lambda mean: sim.Erlang(4, 4 / mean),
+}
+
+# the axes of a sweep and their default levels
+SWEEP_AXES = {
+    "arrival_rate": None,  # EV per hour
+    "utilization": None,  # utilization per EVSE
+    "number_of_EVSE": None,
+    "sim_time": None,  # minutes
+    "fixed_utilization": [True],
+    "arrival_distribution": ["exponential"],
+    "service_distribution": ["exponential"],
+}
+
+# axes which only take whole numbers
+INTEGER_AXES = ("number_of_EVSE", "sim_time")
+
+
+# ------------------------------------------------------------
+# expand a sweep specification to scenarios
+# ------------------------------------------------------------
+def expand_sweep(spec, method="grid", samples=10, random_seed=0):
+    """
+    Expand a sweep specification to a table of scenarios.
+
+    The specification maps each axis of SWEEP_AXES to its levels, e.g.
+
+        spec = {
+            "arrival_rate": [40],
+            "utilization": [0.8, 0.96],
+            "number_of_EVSE": range(1, 11),
+            "sim_time": [5000],
+            "service_distribution": ["exponential", "deterministic"],
+        }
+
+    With method "grid" all combinations of the levels are scenarios. With method "lhs" an axis
+    can also be a range (low, high), which is sampled with a Latin hypercube of samples points;
+    every point is combined with all combinations of the levels of the other axes.
+
+    Args:
+        spec (dict): The levels, or with "lhs" the (low, high) ranges, of the axes.
+        method (str, optional): "grid" or "lhs". Defaults to "grid".
+        samples (int, optional): The number of Latin hypercube points. Defaults to 10.
+        random_seed (int, optional): The seed of the Latin hypercube. Defaults to 0.
+
+    Returns:
+        pandas.DataFrame: One row per scenario, with a column per axis.
+    """
+    unknown = set(spec) - set(SWEEP_AXES)
+    if unknown:
+        raise ValueError(f"unknown sweep axes {sorted(unknown)}, use {list(SWEEP_AXES)}")
+    if method not in ("grid", "lhs"):
+        raise ValueError(f"method must be 'grid' or 'lhs', not {method!r}")
+
+    axes = {**SWEEP_AXES, **spec}
+    missing = [axis for axis, levels in axes.items() if levels is None]
+    if missing:
+        raise ValueError(f"no levels for the sweep axes {missing}")
+
+    ranges = {axis: levels for axis, levels in axes.items() if isinstance(levels, tuple)}
+    levels = {axis: list(levels) for axis, levels in axes.items() if axis not in ranges}
+    if ranges and method == "grid":
+        raise ValueError(f"ranges {list(ranges)} need method 'lhs', a grid needs levels")
+
+    # the Latin hypercube points of the ranges, or a single empty point
+    if ranges:
+        low, high = np.array(list(ranges.values()), dtype=float).T
+        unit = qmc.LatinHypercube(d=len(ranges), seed=random_seed).random(samples)
+        points = [dict(zip(ranges, point)) for point in qmc.scale(unit, low, high)]
+    else:
+        points = [{}]
+
+    scenarios = [
+        {**point, **dict(zip(levels, combination))}
+        for point in points
+        for combination in itertools.product(*levels.values())
+    ]
+    df = pd.DataFrame(scenarios)[list(SWEEP_AXES)]
+    for axis in INTEGER_AXES:
+        df[axis] = df[axis].round().astype("int64")
+    df.insert(0, "scenario", range(len(df)))
+    return df
+
+
+def scenario_distributions(scenario):
+    """
+    Create the inter-arrival time and energy request distributions of a scenario.
+
+    The service rate follows from the utilization per EVSE. With fixed utilization the
+    arrivals are scaled with the number of EVSE's by sim_facility, without it the arrival
+    rate is shared by all EVSE's.
+
+    Args:
+        scenario (dict): A row of expand_sweep.
+
+    Returns:
+        tuple: The inter-arrival time and energy request distributions, in minutes.
+    """
+    c = 1 if scenario["fixed_utilization"] else scenario["number_of_EVSE"]
+    service_rate = scenario["arrival_rate"] / (scenario["utilization"] * c)
+    return (
+        family(scenario["arrival_distribution"])(60 / scenario["arrival_rate"]),
+        family(scenario["service_distribution"])(60 / service_rate),
+    )
+
+
+def family(distribution):
+    """
+    Return the function of the mean of a distribution family, by name or as given.
+    """
+    if callable(distribution):
+        return distribution
+    if distribution not in DISTRIBUTION_FAMILIES:
+        raise ValueError(
+            f"unknown distribution family {distribution!r}, use {list(DISTRIBUTION_FAMILIES)}"
+        )
+    return DISTRIBUTION_FAMILIES[distribution]
+
+
+# ------------------------------------------------------------
+# run a sweep in parallel
+# ------------------------------------------------------------
+def sim_sweep_task(task, **kwargs):
+    scenario, replication = task
+    inter_arr_time_distr, energy_request_distr = scenario_distributions(scenario)
+    sim_runs = sim_facility_replication(
+        inter_arr_time_distr=inter_arr_time_distr,
+        energy_request_distr=energy_request_distr,
+        number_of_EVSE=scenario["number_of_EVSE"],
+        sim_time=scenario["sim_time"],
+        fixed_utilization=scenario["fixed_utilization"],
+        replication=replication,
+        # the scenario, not the number of EVSE's, tells the runs of a sweep apart
+        stream=scenario["scenario"],
+        **kwargs,
+    )
+    for sim_run in sim_runs:
+        sim_run["scenario"] = scenario["scenario"]
+    return sim_runs
+
+
+def sim_sweep(
+    spec,
+    number_of_simulations,
+    method="grid",
+    samples=10,
+    random_seed=0,
+    common_random_numbers=False,
+    antithetic=False,
+    pool=None,
+    cache_dir=None,
+    ffn_results=None,
+    root_seed=None,
+):
+    """
+    Simulate all scenarios of a sweep specification and return one tidy table.
+
+    All replications of all scenarios are tasks for one pool, the scenarios with the most
+    events first, so the outer loops over e.g. utilization levels run in parallel too.
+
+    Args:
+        spec (dict): The sweep specification, see expand_sweep.
+        number_of_simulations (int): The number of simulations per scenario.
+        method (str, optional): "grid" or "lhs". Defaults to "grid".
+        samples (int, optional): The number of Latin hypercube points. Defaults to 10.
+        random_seed (int, optional): The seed of the Latin hypercube. Defaults to 0.
+        common_random_numbers (bool, optional): If True, run i of every scenario uses the
+            same substreams. Defaults to False.
+        antithetic (bool, optional): If True, run the simulations in antithetic pairs. Defaults to False.
+        pool (SimPool, optional): A warm pool to run the simulations. Defaults to the default pathos pool.
+        cache_dir (str, optional): If given, reuse runs stored in this directory. Defaults to None.
+        ffn_results (str, optional): If given, save the table to this file. Defaults to None.
+        root_seed (int, optional): If given, the seed of replication i of a scenario is spawned from
+            this root seed with key (scenario, i), or (i,) with common_random_numbers. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: One row per run, with the scenario columns followed by the results.
+    """
+    df_scenarios = expand_sweep(spec, method, samples, random_seed)
+    scenarios = df_scenarios.to_dict("records")
+
+    # an antithetic pair is one replication
+    replications = (number_of_simulations + 1) // 2 if antithetic else number_of_simulations
+    # the number of EV's is a measure of the number of events of a scenario
+    scenarios.sort(
+        key=lambda s: s["arrival_rate"]
+        * s["sim_time"]
+        * (s["number_of_EVSE"] if s["fixed_utilization"] else 1),
+        reverse=True,
+    )
+    tasks = [(scenario, i) for scenario in scenarios for i in range(replications)]
+
+    p = Pool() if pool is None else pool
+    results = p.map(
+        partial(
+            sim_sweep_task,
+            common_random_numbers=common_random_numbers,
+            antithetic=antithetic,
+            cache_dir=cache_dir,
+            root_seed=root_seed,
+        ),
+        tasks,
+        chunksize=max(1, len(tasks) // (4 * p.ncpus)),
+    )
+
+    # one row per run, in the order of the scenarios and runs
+    df_runs = pd.DataFrame([sim_run for sim_runs in results for sim_run in sim_runs])
+    df_total = (
+        df_scenarios.drop(columns="number_of_EVSE")
+        .merge(df_runs, on="scenario")
+        .sort_values(["scenario", "run"], kind="stable")
+        .reset_index(drop=True)
+    )
+    # name distribution families given as functions
+    for col in ("arrival_distribution", "service_distribution"):
+        df_total[col] = df_total[col].map(lambda d: getattr(d, "__name__", d))
+
+    if ffn_results is not None:
+        write_sim_results(df_total, ffn_results)
+
+    return df_total
@@ -0,0 +1,25 @@
+# Description: checks of the Erlang B and C formulas
+#
+# Run from this directory with: python -m pytest test_sim_erlang.py
+
+import numpy as np
+import pytest
+
+from sim_erlang import erlang_b, erlang_c, mmc
+
+
+def test_float_number_of_servers():
+    assert erlang_b(3.0, 2.4) == erlang_b(3, 2.4)
+    assert erlang_c(3.0, 2.4) == erlang_c(3, 2.4)
+    assert mmc(40.0, 20.0, 3.0)["Wq"] == mmc(40.0, 20.0, 3)["Wq"]
+
+
+def test_fractional_number_of_servers():
+    with pytest.raises(ValueError):
+        erlang_b(2.5, 2.4)
+
+
+def test_array_matches_scalar():
+    c = np.array([1, 3, 10])
+    a = np.array([0.5, 2.4, 8.0])
+    assert np.allclose(erlang_c(c, a), [erlang_c(int(ci), ai) for ci, ai in zip(c, a)])
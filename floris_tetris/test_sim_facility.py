@@ -0,0 +1,56 @@
+# Description: the salabim and vectorized engines of sim_facility give the same results
+#
+# Run from this directory with: python -m pytest test_sim_facility.py
+
+import numpy as np
+import salabim as sim
+
+from sim_facility import sim_facility
+
+# the metrics and control variates which follow from the simulated EV's
+METRICS = ["RO", "Lq", "Wq", "Ls", "Ws", "iat", "service", "warmup"]
+
+
+def run_both_engines(**kwargs):
+    # with common random numbers both engines draw the same EV's
+    inter_arr_time_distr = sim.Exponential(60 / 40)
+    energy_request_distr = sim.Exponential(60 / 40 * 0.9 * 3)
+    return [
+        sim_facility(
+            inter_arr_time_distr=inter_arr_time_distr,
+            energy_request_distr=energy_request_distr,
+            number_of_EVSE=3,
+            sim_time=20000,
+            random_seed=4,
+            common_random_numbers=True,
+            engine=engine,
+            **kwargs,
+        )
+        for engine in ("salabim", "vectorized")
+    ]
+
+
+def assert_same_results(salabim_run, vectorized_run):
+    assert salabim_run.keys() == vectorized_run.keys()
+    for metric in METRICS:
+        if metric not in salabim_run:
+            continue
+        assert np.isclose(salabim_run[metric], vectorized_run[metric]), metric
+
+
+def test_engine_parity_with_warmup():
+    salabim_run, vectorized_run = run_both_engines(warmup="mser5")
+    assert salabim_run["warmup"] > 0
+    assert_same_results(salabim_run, vectorized_run)
+
+
+def test_engine_parity_of_batches():
+    salabim_runs, vectorized_runs = run_both_engines(number_of_batches=4)
+    for salabim_run, vectorized_run in zip(salabim_runs, vectorized_runs):
+        assert_same_results(salabim_run, vectorized_run)
+
+
+def test_engine_parity_of_batches_with_warmup():
+    salabim_runs, vectorized_runs = run_both_engines(warmup="mser5", number_of_batches=4)
+    for salabim_run, vectorized_run in zip(salabim_runs, vectorized_runs):
+        assert_same_results(salabim_run, vectorized_run)
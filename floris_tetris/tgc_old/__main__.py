@@ -29,8 +29,14 @@
 # ------------------------------------------------------------------------
 
 # packages
+import os
+import sys
 import salabim as sim
 from config import *
+
+# block-buffered random variates (floris_tetris/sim_sampler.py)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sim_sampler import buffered_sampler, substreams
 from tgc_floris_padt.test_ev_charge_profile import *
 from plotnine import ggplot, aes, geom_point
 import matplotlib.pyplot as plt
@@ -206,10 +212,8 @@ class EV(sim.Component):
         # enter the waiting line
         self.enter(QUE)
         # check if any SE is available
-        for se in HUB.ses:
-            if se.ispassive():
-                se.activate()
-                break
+        if HUB.idle_ses:
+            HUB.idle_ses.pop().activate()
         self.hold(w, priority=1)  # if not serviced within this time, renege
         if self in QUE:
             self.leave(QUE)
@@ -295,6 +299,7 @@ class SE(sim.Component):
         while True:
             # wait for EV to arrive
             while len(QUE) == 0:
+                HUB.idle_ses.append(self)
                 self.passivate()
 
             # assign EV
@@ -449,6 +454,12 @@ class TGC(sim.Component):
 
 # --------------------------------------------------------------------------
 # Generators
+# --------------------------------------------------------------------------
+# one reproducible generator per random stream, from the random_seed of the app
+STREAMS = ["IAT", "DUR", "ISC", "DSC", "CAP", "MPI", "DEG", "MPO"]
+stream_rng = dict(zip(STREAMS, substreams(random_seed, len(STREAMS))))
+
+
 class EV_Generator(sim.Component):
     """Class to model the behaviour of an Electrical Vehicle (ev).
 
@@ -458,13 +469,13 @@ class EV_Generator(sim.Component):
 
     def setup(self, number_of_evs):
         self.cnt_evs = number_of_evs
-        self.rnd_iat = create_random_generator(params_dict, "IAT")
-        self.rnd_dur = create_random_generator(params_dict, "DUR")
-        self.rnd_isc = create_random_generator(params_dict, "ISC")
-        self.rnd_dsc = create_random_generator(params_dict, "DSC")
-        self.rnd_cap = create_random_generator(params_dict, "CAP")
-        self.rnd_mpi = create_random_generator(params_dict, "MPI")
-        self.rnd_deg = create_random_generator(params_dict, "DEG")
+        self.rnd_iat = buffered_sampler(create_random_generator(params_dict, "IAT"), stream_rng["IAT"])
+        self.rnd_dur = buffered_sampler(create_random_generator(params_dict, "DUR"), stream_rng["DUR"])
+        self.rnd_isc = buffered_sampler(create_random_generator(params_dict, "ISC"), stream_rng["ISC"])
+        self.rnd_dsc = buffered_sampler(create_random_generator(params_dict, "DSC"), stream_rng["DSC"])
+        self.rnd_cap = buffered_sampler(create_random_generator(params_dict, "CAP"), stream_rng["CAP"])
+        self.rnd_mpi = buffered_sampler(create_random_generator(params_dict, "MPI"), stream_rng["MPI"])
+        self.rnd_deg = buffered_sampler(create_random_generator(params_dict, "DEG"), stream_rng["DEG"])
 
     # def registrate(self, ev):
     #     ev.register(self._evs)
@@ -516,8 +527,9 @@ class SE_Generator(sim.Component):
         self.nse = number_of_ses
         self.ncn = number_of_con
         self.ses = []
+        self.idle_ses = []  # stack of passive SEs, so an arriving EV finds one in O(1)
 
-        self.rnd_mpo = create_random_generator(params_dict, "MPO")
+        self.rnd_mpo = buffered_sampler(create_random_generator(params_dict, "MPO"), stream_rng["MPO"])
 
     def process(self):
         i = 1